@@ -1,41 +1,60 @@
+import time
+_started = time.perf_counter()  # for --timings, before the imports below
+
+import hashlib
+import io
+import itertools
+import json
+import os
 import re
 import sys
 from contextlib import nullcontext
 from argparse import ArgumentParser
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import cache
 from typing import *
 from lark import Lark, Tree, Token
 from loguru import logger
 
+# the memory image format is the emulator's, which reads the images back
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from edsac.image import pack_image
+
 # simple assembler targetting EDSAC instruction set
 
-edsac_grammar = Lark(r"""
-    start: line+
+# LALR: "#" and the terminator letters take priority over the perforator
+# letters they overlap with, binary literals over the INT at their start, and an empty
+# source parses as a start with no lines
+edsac_grammar_source = r"""
+    start: line*
     line:   instr
           | const
           | org
           | def
-          | 
           | ret
           | call
           | start_label
           | loc
           | classic
           | space
+          | include
+          | param
           
     # directives:
-    org:                 "org"             INT
+    org:                 "org"             value
+    include:             "include"         ESCAPED_STRING
     start_label:         "start"           address
+    param:               "def_param"       PARAM value
     
     # subroutines:
     def:                 "def_proc"        LABEL ":"
     ret:                 "ret_proc"        LABEL
     call:  [LABEL ":"]   "call"            LABEL
        
-    loc:                 "def_loc"         LABEL INT
+    loc:                 "def_loc"         LABEL INT [value]
     instr:   [LABEL ":"] INSTR [address]   ORDER_TERMINATOR
-    const:   [LABEL ":"] ("def_num" literal_num ORDER_TERMINATOR | "def_char" literal_char )            
-    classic: [LABEL ":"] PERFORATOR_LETTER [address] [/#/] ( CLASSIC_TERMINATOR | CONTROL_TERMINATOR )
+    const:   [LABEL ":"] ("def_num" (literal_num | param_value) ORDER_TERMINATOR | "def_char" literal_char )            
+    classic: [LABEL ":"] PERFORATOR_LETTER [address] [PI_MARK] ( CLASSIC_TERMINATOR | CONTROL_TERMINATOR )
     
     space: "."    
     LABEL: "%return%"? "." SYMBOL
@@ -44,17 +63,27 @@ edsac_grammar = Lark(r"""
            |"inp"|"out"|"verify"|"nop"|"round"|"halt"                      
     ORDER_TERMINATOR: /[fd]/    
     address: INT | LABEL    
+
+    # parameters: $name, or integer arithmetic on them in brackets
+    value: INT | param_value
+    param_value: PARAM | "(" sum ")"
+    ?sum: product | sum "+" product -> add | sum "-" product -> sub
+    ?product: operand | product "*" operand -> mul | product "/" operand -> div
+    ?operand: INT | PARAM | "(" sum ")"
+    PARAM: "$" SYMBOL
         
     literal_num: literal_decimal | literal_binary
     literal_char: "\"" CHARSET+ "\""    
     literal_decimal: [/[+-]/] INT 
-    literal_binary:  [/[+-]/] /[01 _]+b/
+    literal_binary:  [/[+-]/] BINARY
+    BINARY.2: /[01 _]+b/
 
     SYMBOL: ("_"|LETTER|DIGIT)+
     CHARSET: /[PQWERTYUIOJ#SZK\*\.F@D!HNM&LXGABCV0123456789]/ # todo: add figure diacritics in charset
     PERFORATOR_LETTER: /[PQWERTYUIOJ#SZK\*\.F@D!HNM&LXGABCV]/
-    CLASSIC_TERMINATOR: /[F@D!HNM&LXGABCV]/
-    CONTROL_TERMINATOR: /[ZK]/
+    PI_MARK.2: "#"
+    CLASSIC_TERMINATOR.2: /[F@D!HNM&LXGABCV]/
+    CONTROL_TERMINATOR.2: /[ZK]/
 
     COMMENT:   /;[^\n]*/
                | "[" /[^\]]*/ "]"    
@@ -66,18 +95,55 @@ edsac_grammar = Lark(r"""
     %import common.DIGIT
     %import common.LETTER
     %import common.WS
-""")
+    %import common.ESCAPED_STRING
+"""
+
+
+@cache
+def edsac_grammar() -> Lark:
+    "LALR parser, its tables cached on disk between runs"
+    return Lark(edsac_grammar_source, parser="lalr", cache=True)
+
+
+# include "path" splices another source in place, the path relative to the including file
+_include_line = re.compile(r'^\s*include\s+"([^"]*)"', re.MULTILINE)
+
+
+def expand_includes(tree: Tree, base_dir: str, including: tuple[str, ...] = ()) -> Tree:
+    "the tree with each include line replaced by the lines of the included source"
+    lines = []
+    for line in tree.children:
+        match line.children:
+            case [Tree(data="include", children=[Token(value=path_literal)])]:
+                path = os.path.normpath(os.path.join(base_dir, path_literal[1:-1]))
+                if path in including:
+                    raise ValueError(f"{path} includes itself")
+                logger.debug(f"including {path}")
+                with open(path, "r") as source_file:
+                    included = edsac_grammar().parse(source_file.read())
+                lines.extend(expand_includes(included, os.path.dirname(path), including + (path,)).children)
+            case _:
+                lines.append(line)
+    return Tree(tree.data, lines)
+
+
+def included_sources(source_txt: str, base_dir: str) -> list[str]:
+    "texts of the sources a source includes, directly or not, in include order"
+    texts = []
+    for path_literal in _include_line.findall(source_txt):
+        path = os.path.join(base_dir, path_literal)
+        with open(path, "r") as source_file:
+            included_txt = source_file.read()
+        texts.append(included_txt)
+        texts.extend(included_sources(included_txt, os.path.dirname(path)))
+    return texts
 
 
 class Visit:
 
     # todo: better error messages
     # todo: warn when referencing labels in classic mode
-    # todo: warn when overwriting orders
-    # todo: warn when exceeding memory
-    # todo: dump memory image
     # todo: annotate output
-    # todo: fewer passes
     # todo: shift orders with natural parameters
 
     default_org = 56
@@ -119,7 +185,7 @@ class Visit:
             return f"{self.order_code} {order_param_repr:5}{order_pi_repr} {self.order_terminator.upper()}"
 
 
-    def __init__(self):
+    def __init__(self, params: Optional[dict[str, int]] = None):
         self.symbols: dict[str, int] = dict()
         self.opcodes: dict[str, str] = dict(zip(self._ops.values(), self._ops.keys()))
         self.opvalues: dict[int, str] = dict(enumerate(self._charset))
@@ -127,23 +193,95 @@ class Visit:
         self.start_label = ".start"
         self.start_addr = None
         self.filler_order = Visit.Order("Z", "F")
+        # (label, order) for every order addressing a label
+        self.fixups: list[tuple[str, Visit.Order]] = list()
+        # def_param values by name without the $, those given here taking precedence
+        self.overrides: dict[str, int] = dict(params or {})
+        self.params: dict[str, int] = dict()
+        self.org_params: list[str] = list()
+        # layout: the last label defined before each placed word, alignment
+        # fillers, def_loc regions (label, start, words) and overwritten words
+        self.owners: list[Optional[str]] = [None] * Visit.memsize
+        self.last_label: Optional[str] = None
+        self.fillers = 0
+        self.reserved: list[tuple[str, int, int]] = list()
+        self.overwritten: list[tuple[int, Optional[str], Optional[str]]] = list()
+        # labels of f constants, which with packing no d order may address
+        self.short_consts: set[str] = set()
+
+    def define_symbol(self, label: str, mem_index: int) -> None:
+        if label in self.symbols:
+            # as with the old label pass, every reference takes the last definition
+            logger.debug(f"label {label} redefined at {mem_index}, was {self.symbols[label]}")
+        self.symbols[label] = mem_index
+        self.last_label = label
+
+    def place(self, mem_index: int, order: "Visit.Order") -> None:
+        "put an order in the store, warning when it overwrites another"
+        if not 0 <= mem_index < Visit.memsize:
+            raise Exception(f"{self.last_label or 'order'} at {mem_index} is outside the {Visit.memsize} word store")
+        if self.mem[mem_index] is not None:
+            logger.warning(f"{self.last_label} overwrites {self.owners[mem_index]} at {mem_index}")
+            self.overwritten.append((mem_index, self.owners[mem_index], self.last_label))
+        self.mem[mem_index] = order
+        self.owners[mem_index] = self.last_label
+
+    def evaluate(self, node: Union[Tree, Token]) -> int:
+        "value of a parameter expression"
+        match node:
+            case Token(type="INT"):
+                return int(node)
+            case Token(type="PARAM"):
+                name = node.value[1:]
+                if name not in self.params:
+                    raise Exception(f"undefined parameter {node.value}")
+                return self.params[name]
+            case Tree(data="value" | "param_value", children=[child]):
+                return self.evaluate(child)
+            case Tree(data="add", children=[left, right]):
+                return self.evaluate(left) + self.evaluate(right)
+            case Tree(data="sub", children=[left, right]):
+                return self.evaluate(left) - self.evaluate(right)
+            case Tree(data="mul", children=[left, right]):
+                return self.evaluate(left) * self.evaluate(right)
+            case Tree(data="div", children=[left, right]):
+                return self.evaluate(left) // self.evaluate(right)
+        raise Exception(f"unrecognised parameter expression {node}")
+
+    def param_literal(self, param_value: Tree) -> Tree:
+        "a literal_num for the value of a parameter expression"
+        value = self.evaluate(param_value)
+        if value < 0:
+            raise Exception(f"def_num of negative parameter value {value}")
+        return Tree("literal_decimal", [None, Token("INT", str(value))])
 
-    def resolve_address(self, addr_tok: Token) -> int:
+    def resolve_address(self, addr_tok: Token, order: "Visit.Order") -> int:
+        "address for an order; labels are recorded and patched once the source is placed"
         match addr_tok:
             case Token(type="INT", value=addr):
                 return int(addr)
             case Token(type="LABEL", value=label):
-                return self.symbols[label]
+                self.fixups.append((label, order))
+                return self.symbols.get(label, 0)
+
+    def patch_fixups(self) -> None:
+        undefined: dict[str, int] = dict()
+        for label, order in self.fixups:
+            if label in self.symbols:
+                order.order_param = self.symbols[label]
+            else:
+                undefined[label] = undefined.get(label, 0) + 1
+        if undefined:
+            raise Exception("undefined labels: " + ", ".join(f"{label} ({uses} uses)" for label, uses in undefined.items()))
 
     def maybe_set_symbol(self, label_tok: Token, mem_index: int) -> None:
         if label_tok is not None:
-            self.symbols[label_tok.value] = mem_index
+            self.define_symbol(label_tok.value, mem_index)
 
-    def make_order_addr(self, order_param: Tree) -> int:
-        if order_param is None:
-            return 0
-        else:
-            return self.resolve_address(order_param.children[0])
+    def set_order_addr(self, order: "Visit.Order", order_param: Tree) -> "Visit.Order":
+        if order_param is not None:
+            order.order_param = self.resolve_address(order_param.children[0], order)
+        return order
 
     def make_order_pi(self, order_param_tok: Token) -> bool:
         if order_param_tok is None:
@@ -162,11 +300,9 @@ class Visit:
             ]:
                 assert opcode in self.opcodes.keys()
                 order_code = self.opcodes[opcode]
-                order_addr = self.make_order_addr(order_addr_tok)
-                order_term = order_term
             case _:
                 raise Exception(f"unrecognised instruction {instr_line}")
-        return Visit.Order(order_code, order_term, order_addr)
+        return self.set_order_addr(Visit.Order(order_code, order_term), order_addr_tok)
 
     def make_int_order(self, literal_val: int) -> Order:
         order_code = self.opvalues[literal_val >> 12]
@@ -242,27 +378,32 @@ class Visit:
             orders_output_stream = None,
             emit_pk_spaces = True,
             emit_location = False,
+            pack = False,
     ) -> None:
 
         emit_ekpf_launcher = True
         emit_pktk_headers = True
 
-        # 1st pass: label positions
+        # single pass: place orders, then backpatch label references
 
         mem_index = org
-        for line in tree.children:
-            mem_index = self.visit_labels(line, mem_index)
+        lines = tree.children
+        index = 0
+        while index < len(lines):
+            run_end = index
+            while pack and run_end < len(lines) and self.const_width(lines[run_end]):
+                run_end += 1
+            for line in self.packed(lines[index:run_end], mem_index) if run_end > index else lines[index:index + 1]:
+                mem_index = self.visit_line(line, mem_index)
+            index = max(run_end, index + 1)
+        self.patch_fixups()
+        if pack:
+            self.check_packed_widths()
         if symbols_listing_stream is not None:
             for k, v in self.symbols.items():
                 print(f"{k} {v}", file=symbols_listing_stream)
 
-        # 2nd pass: assemble orders
-
-        mem_index = org
-        for line in tree.children:
-            mem_index = self.visit_orders(line, mem_index)
-
-        # 3rd pass: emit assembled orders
+        # emit assembled orders
 
         indent = " " * 7
         symbols_reverse = {v:k for k,v in self.symbols.items()}
@@ -283,13 +424,64 @@ class Visit:
         if emit_ekpf_launcher:
             self.ekpf_launcher(indent, orders_output_stream)
 
-    def ekpf_launcher(self, indent, orders_output_stream):
+    @staticmethod
+    def const_width(line: Tree) -> int:
+        "words of a def_num line, 0 for any other line"
+        match line.children:
+            case [Tree(data="const", children=[_, Tree(data="literal_num" | "param_value"), Token(value=term)])]:
+                return Visit._width[term]
+        return 0
+
+    @staticmethod
+    def packed(run: list[Tree], mem_index: int) -> list[Tree]:
+        "a run of def_num lines reordered so no d constant needs an alignment filler"
+        # one f constant first when the run starts on an odd word, then the d
+        # constants, then the remaining f constants
+        doubles = [line for line in run if Visit.const_width(line) == 2]
+        singles = [line for line in run if Visit.const_width(line) == 1]
+        if not doubles:
+            return run
+        lead = singles[:1] if mem_index % 2 == 1 else []
+        return lead + doubles + singles[len(lead):]
+
+    def check_packed_widths(self) -> None:
+        "packing moves constants, so a d order on an f constant would reach a word it was not declared next to"
+        labels = sorted({label for label, order in self.fixups if label in self.short_consts and order.order_terminator in ("d", "D")})
+        if labels:
+            raise Exception(f"{', '.join(labels)}: def_num f addressed with d, declare as d to pack")
+
+    def layout(self) -> "Layout":
+        "footprint of the placed program and its def_loc regions, and everything that overlaps"
+        placed = [index for index, order in enumerate(self.mem) if order is not None]
+        overlaps = [f"{new} overwrites {old} at {index}" for index, old, new in self.overwritten]
+        for label, start, words in self.reserved:
+            if start + words > Visit.memsize:
+                overlaps.append(f"{label} {start}..{start + words - 1} runs past the {Visit.memsize} word store")
+            clashes = [index for index in placed if start <= index < start + words]
+            if clashes:
+                overlaps.append(f"{label} {start}..{start + words - 1} overlaps {self.owners[clashes[0]]} at {clashes[0]}"
+                                + (f" and {len(clashes) - 1} more words" if len(clashes) > 1 else ""))
+        for (label, start, words), (other, other_start, other_words) in itertools.combinations(self.reserved, 2):
+            if start < other_start + other_words and other_start < start + words:
+                overlaps.append(f"{label} {start}..{start + words - 1} overlaps {other} {other_start}..{other_start + other_words - 1}")
+        return Layout(
+            placed=len(placed),
+            fillers=self.fillers,
+            code_start=min(placed, default=0),
+            code_end=max(placed, default=-1),
+            reserved=list(self.reserved),
+            overlaps=overlaps,
+        )
+
+    def start_address(self) -> Optional[int]:
         if self.start_label in self.symbols:
-            start_order = Visit.Order("E", "K", self.symbols[self.start_label])
-            print(indent + str(start_order), file=orders_output_stream)
-            print(indent + str(Visit.Order("P", "F")), file=orders_output_stream)
-        elif self.start_addr is not None:
-            start_order = Visit.Order("E", "K", self.start_addr)
+            return self.symbols[self.start_label]
+        return self.start_addr
+
+    def ekpf_launcher(self, indent, orders_output_stream):
+        start_addr = self.start_address()
+        if start_addr is not None:
+            start_order = Visit.Order("E", "K", start_addr)
             print(indent + str(start_order), file=orders_output_stream)
             print(indent + str(Visit.Order("P", "F")), file=orders_output_stream)
         else:
@@ -301,138 +493,613 @@ class Visit:
         print(indent + str(Visit.Order("P", "K")), file=stream)
         print(indent + str(Visit.Order("T", "K", index)), file=stream)
 
-    def visit_labels(self, line: Tree, mem_index: int) -> int:
-        "resolve location of labels"
-        next_mem_index = mem_index
+    def order_word(self, order: Order) -> int:
+        "17 bit store word, as initial orders would load it"
+        long = order.order_terminator in ("d", "D") or order.order_pi
+        return (self._charset.index(order.order_code) << 12) | ((order.order_param & 0x7FF) << 1) | long
+
+    def image(self) -> bytes:
+        "memory image: the store as loaded, start address and symbol table"
+        words = [0] * Visit.memsize
+        loaded = set()
+        for index, order in enumerate(self.mem):
+            # control combinations direct the loader and never reach the store
+            if order is None or order.order_terminator not in ("f", "d", "F", "D"):
+                continue
+            words[index] = self.order_word(order)
+            loaded.add(index)
+        return pack_image(words, loaded, self.start_address(), self.symbols)
+
+    def visit_line(self, line: Tree, mem_index: int) -> int:
+        "place the orders for one line, returning the next location"
         assert line.data == "line"
+        next_mem_index = mem_index
         match line.children:
-            case [Tree(data="org", children=[Token("INT", org)])]:
-                next_mem_index = int(org)
-            case [Tree(data="instr", children=[label, *_])]:
-                self.maybe_set_symbol(label, mem_index)
+            case [Tree(data="org", children=[org])]:
+                if isinstance(org.children[0], Tree):
+                    self.org_params.extend(token.value[1:] for token in org.scan_values(lambda v: isinstance(v, Token) and v.type == "PARAM"))
+                next_mem_index = self.evaluate(org)
+            case [Tree(data="param", children=[Token(type="PARAM", value=name), value])]:
+                name = name[1:]
+                self.params[name] = self.overrides[name] if name in self.overrides else self.evaluate(value)
+            case [Tree(data="instr", children=instr)]:
+                self.maybe_set_symbol(instr[0], mem_index)
+                self.place(mem_index, self.make_order(instr))
                 next_mem_index = mem_index + 1
-            case [Tree(data="const", children=[label, Tree(data="literal_num"), term])]:
+            case [Tree(data="const", children=[label, Tree(data="literal_num" | "param_value") as literal_tree, term])]:
                 width = Visit._width[term]
                 if mem_index % 2 == 1 and width == 2:
+                    self.place(mem_index, self.filler_order)
+                    self.fillers += 1
                     mem_index += 1
                 self.maybe_set_symbol(label, mem_index)
+                if label is not None and width == 1:
+                    self.short_consts.add(label.value)
+                literal = literal_tree.children[0] if literal_tree.data == "literal_num" else self.param_literal(literal_tree)
+                for index, order in enumerate(self.make_const_order(literal, width)):
+                    self.place(mem_index + index, order)
+                assert width == index + 1, "Order width mismatch"
                 next_mem_index = mem_index + width
             case [Tree(data="const",
                        children=[label, Tree(data="literal_char", children=const)])]:
                 self.maybe_set_symbol(label, mem_index)
-                next_mem_index = mem_index + len(const)
+                for index, char in enumerate(const):
+                    self.place(mem_index + index, Visit.Order(char.value, "F"))
+                next_mem_index += len(const)
             case [Tree(data="def", children=[label])]:
-                self.symbols[label.value] = mem_index
+                self.define_symbol(label.value, mem_index)
                 if label != self.start_label:
+                    return_order = Visit.Order("T", "F")
+                    return_order.order_param = self.resolve_address(Token("LABEL", "%return%" + label.value), return_order)
+                    self.place(mem_index + 0, Visit.Order("A", "F", 3))
+                    self.place(mem_index + 1, return_order)
                     next_mem_index = mem_index + 2
             case [Tree(data="ret", children=[label])]:
-                self.symbols["%return%" + label.value] = mem_index
+                self.define_symbol("%return%" + label.value, mem_index)
+                self.place(mem_index, self.filler_order)
                 next_mem_index = mem_index + 1
-            case [Tree(data="call", children=[label, *_])]:
+            case [Tree(data="call", children=[label, label_callee])]:
                 self.maybe_set_symbol(label, mem_index)
+                call_order = Visit.Order("G", "F")
+                call_order.order_param = self.resolve_address(label_callee, call_order)
+                self.place(mem_index + 0, Visit.Order("A", "F", mem_index))
+                self.place(mem_index + 1, call_order)
                 next_mem_index = mem_index + 2
-            case [Tree(data="loc", children=[label, loc])]:
-                addr = int(loc.value)
-                self.symbols[label.value] = addr
+            case [Tree(data="loc", children=[label, loc, words])]:
+                self.define_symbol(label.value, int(loc.value))
+                if words is not None:
+                    self.reserved.append((label.value, int(loc.value), self.evaluate(words)))
             case [Tree(data="start_label", children=[Tree(data="address", children=[start_label])])]:
                 match start_label.type:
                     case "INT": self.start_addr = int(start_label)
                     case "LABEL": self.start_label = start_label.value
-            case [Tree(data="classic", children=[label, *_])]:
+            case [Tree(data="classic",
+                       children=[label, Token(value=order_code), order_addr_tok, order_pi_tok, Token(value=order_term)])]:
                 self.maybe_set_symbol(label, mem_index)
+                order_pi = self.make_order_pi(order_pi_tok)
+                classic_order = Visit.Order(order_code, order_term, 0, order_pi)
+                self.place(mem_index, self.set_order_addr(classic_order, order_addr_tok))
                 next_mem_index = mem_index + 1
-            case [Tree(data=Token(_, "space"))]:
+            case [Tree(data="space")]:
                 pass
             case _:
-                logger.warning(f"ignoring while computing label positions: {line.children}")
+                logger.warning(f"ignoring: {line.children}")
         return next_mem_index
 
 
-    def visit_orders(self, line: Tree, mem_index: int) -> int:
-        assert line.data == "line"
-        next_mem_index = mem_index
+class Peephole:
+    "opt-in order stream optimizer, run on the parsed lines before they are placed"
+
+    # rules only touch unlabelled instr lines with numeric addresses, so jump
+    # targets, self-modified slots and anything addressed by label stay put.
+    #
+    #   nop      X orders are dropped
+    #   clear    "mov 0" is dropped when the accumulator is already clear and
+    #            location 0 is never read
+    #   shift    neighbouring shifts the same way merge while one order can
+    #            still encode the total
+
+    # order times in ms, as edsac.TimingModel; repeated so asm.py runs on its own
+    ordinary_ms = 1.5
+    multiply_ms = 6.0
+    _reads = {"add", "sub", "mov_mult", "mult_add", "mult_sub", "and", "out"}
+    _clears = {"mov"}
+    _keeps_acc = {"mov_mult", "out", "inp", "verify", "nop", "mov_dirty"}
+    _jumps = {"jge", "jlt"}
+    _shifts = {"lshift", "rshift"}
+
+    @dataclass
+    class Change:
+        rule: str
+        proc: str
+        order: "Visit.Order"
+        weight: int
+
+    def __init__(self, inner_trips: Optional[int] = None, symbols: Optional[dict[str, int]] = None):
+        self.visit = Visit()
+        self.inner_trips = inner_trips
+        # label addresses before optimizing; a read through a label not here may be of location 0
+        self.symbols = symbols or {}
+        self.changes: list[Peephole.Change] = []
+
+    def order_of(self, line: Tree) -> Optional["Visit.Order"]:
+        "the order for an instr line with a numeric or no address, else None"
         match line.children:
-            case [Tree(data="org", children=[Token("INT", org)])]:
-                next_mem_index = int(org)
-            case [Tree(data="instr", children=instr)]:
-                self.mem[mem_index] = self.make_order(instr)
-                next_mem_index = mem_index + 1
-            case [Tree(data="const", children=[_label, Tree(data="literal_num", children=[literal]), term])]:
-                width = Visit._width[term]
-                if mem_index % 2 == 1 and width == 2:
-                    self.mem[mem_index] = self.filler_order
-                    mem_index += 1
-                for index, order in enumerate(self.make_const_order(literal, width)):
-                    self.mem[mem_index + index] = order
-                assert width == index + 1, "Order width mismatch"
-                next_mem_index = mem_index + width
-            case [Tree(data="const",
-                       children=[_label, Tree(data="literal_char", children=const)])]:
-                for index, char in enumerate(const):
-                    self.mem[mem_index + index] = Visit.Order(char.value, "F")
-                next_mem_index += len(const)
-            case [Tree(data="def", children=[label])]:
-                if label != self.start_label:
-                    return_address = self.symbols["%return%" + label.value]
-                    self.mem[mem_index + 0] = Visit.Order("A", "F", 3)
-                    self.mem[mem_index + 1] = Visit.Order("T", "F", return_address)
-                    next_mem_index = mem_index + 2
-            case [Tree(data="call", children=[_label, label_callee])]:
-                callee_address = self.symbols[label_callee.value]
-                self.mem[mem_index + 0] = Visit.Order("A", "F", mem_index)
-                self.mem[mem_index + 1] = Visit.Order("G", "F", callee_address)
-                next_mem_index = mem_index + 2
-            case [Tree(data="loc", children=[label, loc])]:
-                pass
-            case [Tree(data="ret")]:
-                self.mem[mem_index] = self.filler_order
-                next_mem_index = mem_index + 1
-            case [Tree(data="classic",
-                       children=[_, Token(value=order_code), order_addr_tok, order_pi_tok, Token(value=order_term)])]:
-                order_addr = self.make_order_addr(order_addr_tok)
-                order_pi = self.make_order_pi(order_pi_tok)
-                classic_order = Visit.Order(order_code, order_term, order_addr, order_pi)
-                self.mem[mem_index] = classic_order
-                next_mem_index = mem_index + 1
-            case [Tree(data="space")]:
-                pass
-            case [Tree(data="start_label")]:
+            case [Tree(data="instr", children=[_label, Token("INSTR", opcode), address, Token(value=term)])]:
+                if address is not None and address.children[0].type != "INT":
+                    return None
+                param = int(address.children[0]) if address is not None else 0
+                return Visit.Order(self.visit.opcodes[opcode], term, param)
+        return None
+
+    def may_read_zero(self, line: Tree) -> bool:
+        "whether the order on a line may read location 0, a long read of the 0/1 pair included"
+        match line.children:
+            case [Tree(data="instr", children=[_label, Token(value=opcode), address, Token(value=term)])]:
                 pass
+            case [Tree(data="classic", children=[_label, Token(value=code), address, pi_mark, Token(value=term)])]:
+                if pi_mark is not None:
+                    # relative to where the order is loaded
+                    return Visit._ops.get(code) in self._reads
+                opcode = Visit._ops.get(code)
             case _:
-                logger.warning(f"ignoring while generating orders: {line.children}")
-        return next_mem_index
+                return False
+        if opcode not in self._reads:
+            return False
+        if address is None:
+            n = 0
+        elif address.children[0].type == "INT":
+            n = int(address.children[0])
+        elif address.children[0].value in self.symbols:
+            n = self.symbols[address.children[0].value]
+        else:
+            return True
+        return n == 0 or (n == 1 and term in ("d", "D"))
+
+    @staticmethod
+    def shift_places(order: "Visit.Order") -> int:
+        word = (Visit._charset.index(order.order_code) << 12) | (order.order_param << 1) | (order.order_terminator in ("d", "D"))
+        return (word & -word).bit_length()
+
+    @staticmethod
+    def shift_order(code: str, places: int) -> Optional["Visit.Order"]:
+        "a shift order of this many places, None when no single order encodes it"
+        candidates = [Visit.Order(code, "d", 0), Visit.Order(code, "f", 0)]
+        candidates += [Visit.Order(code, "f", 1 << bit) for bit in range(11)]
+        for order in candidates:
+            if Peephole.shift_places(order) == places:
+                return order
+        return None
+
+    def weights(self, lines: list[Tree]) -> dict[int, int]:
+        "estimated executions per outer iteration of the start proc, by line index"
+        # loops are backward jumps within a def_proc; in the start proc the
+        # outermost loop is the outer iteration and loops inside it run
+        # inner_trips times. loops in other procs are data dependent and
+        # counted once. a proc runs once per call from its callers.
+        procs: dict[str, tuple[int, int]] = {}
+        labels: dict[str, int] = {}
+        proc_name, proc_start = None, 0
+        for index, line in enumerate(lines):
+            match line.children:
+                case [Tree(data="def", children=[label])]:
+                    proc_name, proc_start = label.value, index
+                case [Tree(data="ret", children=[label])]:
+                    procs[label.value] = (proc_start, index)
+                    proc_name = None
+                case [Tree(data="def" | "instr" | "const" | "call" | "classic", children=[Token(type="LABEL") as label, *_])]:
+                    labels[label.value] = index
+        loops = []
+        for index, line in enumerate(lines):
+            match line.children:
+                case [Tree(data="instr", children=[_, Token("INSTR", opcode), Tree(children=[Token(type="LABEL", value=target)]), _])]:
+                    if opcode in self._jumps and labels.get(target, index) < index:
+                        loops.append((labels[target], index))
+
+        start_label = self.visit.start_label
+        for line in lines:
+            match line.children:
+                case [Tree(data="start_label", children=[Tree(children=[Token(type="LABEL", value=label)])])]:
+                    start_label = label
+
+        def depth(index: int) -> int:
+            return sum(1 for low, high in loops if low <= index <= high)
+
+        def proc_of(index: int) -> Optional[str]:
+            for name, (low, high) in procs.items():
+                if low <= index <= high:
+                    return name
+            return None
+
+        calls: dict[str, list[int]] = {}
+        for index, line in enumerate(lines):
+            match line.children:
+                case [Tree(data="call", children=[_, callee])]:
+                    calls.setdefault(callee.value, []).append(index)
+
+        @cache
+        def proc_weight(name: Optional[str]) -> int:
+            if name is None or name == start_label:
+                return 1
+            return sum(line_weight(site) for site in calls.get(name, []))
+
+        def line_weight(index: int) -> int:
+            name = proc_of(index)
+            if name == start_label and depth(index) >= 2:
+                return (self.inner_trips or 1) * proc_weight(name)
+            return proc_weight(name)
+
+        return {index: line_weight(index) for index in range(len(lines))}
+
+    def optimize(self, tree: Tree) -> Tree:
+        lines = tree.children
+        if self.inner_trips is None:
+            raise Exception("inner loop trips per outer iteration are needed to weigh the changes")
+        weights = self.weights(lines)
+        zero_read = any(map(self.may_read_zero, lines))
+
+        kept: list[Tree] = []
+        acc_clear = False
+        proc = "(none)"
+        last_shift: Optional[int] = None  # index in kept of a shift the next one may merge into
+        for index, line in enumerate(lines):
+            kind = line.children[0].data if line.children else None
+            if kind in ("space", "loc", "start_label", "param"):
+                # no orders placed, the state carries on
+                kept.append(line)
+                continue
+            if kind == "def":
+                proc = line.children[0].children[0].value
+            elif kind == "ret":
+                proc = "(none)"
+            order = self.order_of(line)
+            opcode = line.children[0].children[1].value if kind == "instr" else None
+
+            if kind != "instr":
+                # a def_proc prologue "A 3 F; T ret F" leaves the accumulator clear
+                acc_clear = kind == "def"
+                last_shift = None
+                kept.append(line)
+                continue
+            if self.label_of(line) is not None or order is None:
+                # jump targets and orders addressed by label stay as they are
+                if self.label_of(line) is not None:
+                    acc_clear = False
+                acc_clear = opcode in self._clears or (acc_clear and opcode in self._keeps_acc | self._jumps)
+                last_shift = len(kept) if order is not None and opcode in self._shifts else None
+                kept.append(line)
+                continue
+
+            weight = weights[index]
+            if opcode == "nop":
+                self.changes.append(Peephole.Change("nop", proc, order, weight))
+                continue
+            if opcode == "mov" and order.order_param == 0 and acc_clear and not zero_read:
+                self.changes.append(Peephole.Change("clear", proc, order, weight))
+                continue
+            if opcode in self._shifts and last_shift is not None:
+                previous = self.order_of(kept[last_shift])
+                if previous.order_code == order.order_code:
+                    merged = self.shift_order(order.order_code, self.shift_places(previous) + self.shift_places(order))
+                    if merged is not None:
+                        kept[last_shift] = self.instr_line(kept[last_shift], opcode, merged)
+                        self.changes.append(Peephole.Change("shift", proc, order, weight))
+                        continue
+            acc_clear = opcode in self._clears or (acc_clear and opcode in self._keeps_acc | self._jumps)
+            last_shift = len(kept) if opcode in self._shifts else None
+            kept.append(line)
+        return Tree(tree.data, kept)
+
+    @staticmethod
+    def label_of(line: Tree) -> Optional[str]:
+        match line.children:
+            case [Tree(children=[Token(type="LABEL", value=label), *_])]:
+                return label
+        return None
+
+    @staticmethod
+    def instr_line(line: Tree, opcode: str, order: "Visit.Order") -> Tree:
+        label = line.children[0].children[0]
+        address = Tree("address", [Token("INT", str(order.order_param))])
+        return Tree("line", [Tree("instr", [label, Token("INSTR", opcode), address, Token("ORDER_TERMINATOR", order.order_terminator)])])
+
+    def order_ms(self, order: "Visit.Order") -> float:
+        return self.multiply_ms if order.order_code in ("V", "N") else self.ordinary_ms
+
+    def report(self) -> str:
+        lines = [f"peephole: {len(self.changes)} orders removed, inner loop trips {self.inner_trips or 1}"]
+        lines.append(f"{'proc':<24} {'removed':>7} {'per outer iteration':>20} {'ms':>10}")
+        procs: dict[str, list[Peephole.Change]] = {}
+        for change in self.changes:
+            procs.setdefault(change.proc, []).append(change)
+        total_orders = 0
+        total_ms = 0.0
+        for proc, changes in procs.items():
+            orders = sum(change.weight for change in changes)
+            ms = sum(change.weight * self.order_ms(change.order) for change in changes)
+            rules = ", ".join(f"{rule} {sum(1 for c in changes if c.rule == rule)}" for rule in dict.fromkeys(c.rule for c in changes))
+            lines.append(f"{proc:<24} {len(changes):7d} {orders:20d} {ms:10.1f}  {rules}")
+            total_orders += orders
+            total_ms += ms
+        lines.append(f"{'total':<24} {len(self.changes):7d} {total_orders:20d} {total_ms:10.1f}")
+        return "\n".join(lines)
+
+
+@dataclass
+class Layout:
+    "where an assembled program sits in the store"
+    placed: int
+    fillers: int
+    code_start: int
+    code_end: int
+    reserved: list[tuple[str, int, int]]  # def_loc label, start, words
+    overlaps: list[str]
+
+    @property
+    def free(self) -> int:
+        return Visit.memsize - self.placed - sum(words for _, _, words in self.reserved)
+
+    def report(self) -> str:
+        lines = [f"orders and data {self.placed:4d} words at {self.code_start}..{self.code_end}, {self.fillers} alignment fillers"]
+        for label, start, words in self.reserved:
+            lines.append(f"{label:<15} {words:4d} words at {start}..{start + words - 1}")
+        lines.append(f"free            {self.free:4d} of {Visit.memsize} words")
+        lines.extend(f"overlap: {overlap}" for overlap in self.overlaps)
+        return "\n".join(lines)
+
+
+@dataclass
+class Plan:
+    params: dict[str, int]
+    layout: Layout
+    # whether the planned values only fit with the constants packed
+    needs_pack: bool = False
+
+    def report(self) -> str:
+        params = ", ".join(f"${name} {value}" for name, value in self.params.items())
+        report = f"{self.layout.report()}\nparameters: {params}"
+        return report + ("\nassemble with --pack, the plan only fits packed" if self.needs_pack else "")
+
+
+def place_program(ast: Tree, params: dict[str, int], pack: bool = False, org: int = Visit.default_org) -> Visit:
+    "a Visit with the program placed, its orders thrown away"
+    visitor = Visit(params)
+    visitor.visit(ast, org=org, orders_output_stream=io.StringIO(), pack=pack)
+    return visitor
+
+
+def plan_layout(source_txt: str, maximise: str, params: Optional[dict[str, int]] = None,
+                source_name: str = "<source>") -> Plan:
+    "the largest value of the parameter maximise that leaves nothing overlapping, with the code against the top of the store and packed"
+    ast = expand_includes(edsac_grammar().parse(source_txt), os.path.dirname(source_name))
+    params = dict(params or {})
+    pack = True
+
+    def fitting(values: dict[str, int], pack: bool = True) -> Optional[Visit]:
+        try:
+            visitor = place_program(ast, values, pack)
+        except Exception:
+            return None
+        return None if visitor.layout().overlaps else visitor
+
+    probe = place_program(ast, params | {maximise: 0}, pack)
+    if maximise not in probe.params:
+        raise Exception(f"no def_param ${maximise} in {source_name}")
+    org_params = [name for name in dict.fromkeys(probe.org_params) if name not in params]
+    if len(org_params) == 1:
+        # measure the code low down, then move it up against the top of the store;
+        # packing depends on where each run starts, so the origins either side are tried too
+        org_param = org_params[0]
+        measured = place_program(ast, params | {maximise: 0, org_param: Visit.default_org}, pack).layout()
+        span = measured.code_end - measured.code_start + 1
+        for org in range(Visit.memsize - span + 1, Visit.memsize - span - 3, -1):
+            try:
+                place_program(ast, params | {maximise: 0, org_param: org}, pack)
+            except Exception:
+                # runs off the top of the store
+                continue
+            params[org_param] = org
+            break
+
+    if fitting(params | {maximise: 0}) is None:
+        overlaps = place_program(ast, params | {maximise: 0}, pack).layout().overlaps
+        raise Exception(f"{source_name} does not fit with ${maximise} 0: " + "; ".join(overlaps))
+    low, high = 0, Visit.memsize
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fitting(params | {maximise: middle}) is not None:
+            low = middle
+        else:
+            high = middle - 1
+    visitor = fitting(params | {maximise: low})
+    return Plan(visitor.params, visitor.layout(), fitting(visitor.params, pack=False) is None)
+
+
+_param_line = re.compile(r"^(\s*def_param\s+\$(\w+)\s+)(\d+)", re.MULTILINE)
+
+
+def write_params(source_txt: str, values: dict[str, int]) -> str:
+    "source with each def_param given a number set to its value in values"
+    def replace(match: re.Match) -> str:
+        name = match.group(2)
+        return match.group(1) + str(values[name]) if name in values else match.group(0)
+    return _param_line.sub(replace, source_txt)
+
+
+@dataclass
+class Timings:
+    startup_s: float = 0.0
+    parser_s: float = 0.0
+    files: list[tuple[str, float, float]] = field(default_factory=list)  # source, parse, assemble
+
+    def report(self) -> str:
+        lines = [f"startup {1000 * self.startup_s:8.1f} ms", f"parser  {1000 * self.parser_s:8.1f} ms"]
+        for source, parse_s, assemble_s in self.files:
+            lines.append(f"{source}: parse {1000 * parse_s:.1f} ms, assemble {1000 * assemble_s:.1f} ms")
+        return "\n".join(lines)
+
+
+def assemble(source_txt: str, org: int = Visit.default_org, emit_location: bool = False,
+             timings: Optional[Timings] = None, source_name: str = "<source>",
+             optimize: bool = False, inner_trips: Optional[int] = None, params: Optional[dict[str, int]] = None,
+             pack: bool = False, report_layout: bool = False) -> tuple[str, str, bytes]:
+    "assembled orders, symbol listing and memory image for a source text"
+    parser_started = time.perf_counter()
+    parser = edsac_grammar()
+    parse_started = time.perf_counter()
+    ast = expand_includes(parser.parse(source_txt), os.path.dirname(source_name))
+    logger.debug(f"ast node count: {len(list(ast.iter_subtrees()))}")
+    assemble_started = time.perf_counter()
+    if optimize:
+        # label addresses, so the optimizer sees reads of location 0 through a
+        # label, and the remainder array length as placed for the inner trips
+        placed = place_program(ast, params or {}, pack, org)
+        if inner_trips is None:
+            if ".const_array_len" not in placed.symbols:
+                raise Exception(f"{source_name}: no .const_array_len to count inner loop trips from, give them with --inner_trips")
+            inner_trips = placed.order_word(placed.mem[placed.symbols[".const_array_len"]])
+        peephole = Peephole(inner_trips, placed.symbols)
+        ast = peephole.optimize(ast)
+        logger.info(f"{source_name}\n" + peephole.report())
+    orders_output = io.StringIO()
+    symbols_listing = io.StringIO()
+    visitor = Visit(params)
+    visitor.visit(
+        ast,
+        org=org,
+        orders_output_stream=orders_output,
+        symbols_listing_stream=symbols_listing,
+        emit_location=emit_location,
+        pack=pack,
+    )
+    layout = visitor.layout()
+    # orders overwriting orders were warned of as they were placed
+    for overlap in layout.overlaps[len(visitor.overwritten):]:
+        logger.warning(f"{source_name}: {overlap}")
+    if report_layout:
+        logger.info(f"{source_name}\n" + layout.report())
+    image = visitor.image()
+    if timings is not None:
+        timings.parser_s += parse_started - parser_started
+        timings.files.append((source_name, assemble_started - parse_started, time.perf_counter() - assemble_started))
+    return orders_output.getvalue(), symbols_listing.getvalue(), image
+
+
+def assemble_batch(source_dir: str, output_dir: str, org: int, emit_location: bool,
+                   timings: Optional[Timings] = None, write_images: bool = False, optimize: bool = False) -> list[str]:
+    "assemble every .asm in source_dir to output_dir, skipping sources whose hash is unchanged"
+    hashes_path = os.path.join(output_dir, ".asm_hashes.json")
+    try:
+        with open(hashes_path) as hashes_file:
+            hashes = json.load(hashes_file)
+    except (FileNotFoundError, ValueError):
+        hashes = {}
+    # a change to the assembler or its options rebuilds everything
+    with open(__file__, "rb") as assembler_file:
+        assembler_hash = hashlib.sha256(assembler_file.read()).hexdigest()
+    options = f"{assembler_hash} org={org} addresses={emit_location} images={write_images} optimize={optimize}"
+
+    os.makedirs(output_dir, exist_ok=True)
+    assembled = []
+    for source_name in sorted(os.listdir(source_dir)):
+        if not source_name.endswith(".asm"):
+            continue
+        source_path = os.path.join(source_dir, source_name)
+        orders_path = os.path.join(output_dir, source_name[:-len(".asm")] + ".e")
+        image_path = os.path.join(output_dir, source_name[:-len(".asm")] + ".img")
+        with open(source_path, "r") as source_file:
+            source_txt = source_file.read()
+        # included sources count as part of the source
+        included_txt = "\n".join(included_sources(source_txt, source_dir))
+        source_hash = hashlib.sha256(f"{options}\n{source_txt}\n{included_txt}".encode()).hexdigest()
+        if hashes.get(source_name) == source_hash and os.path.exists(orders_path):
+            logger.debug(f"{source_path} unchanged")
+            continue
+        logger.info(f"assembling {source_path} to {orders_path}")
+        orders, _, image = assemble(source_txt, org, emit_location, timings, source_path, optimize)
+        with open(orders_path, "w") as orders_file:
+            orders_file.write(orders)
+        if write_images:
+            with open(image_path, "wb") as image_file:
+                image_file.write(image)
+        hashes[source_name] = source_hash
+        assembled.append(source_path)
+
+    with open(hashes_path, "w") as hashes_file:
+        json.dump(hashes, hashes_file, indent=1, sort_keys=True)
+    return assembled
 
 
 def main(commandline: list[str]) -> None:
     logger.info("Last orders assembler")
+    timings = Timings(startup_s=time.perf_counter() - _started)
     arg_parser = ArgumentParser()
-    arg_parser.add_argument("source", help="Assembly source")
+    arg_parser.add_argument("source", help="Assembly source", nargs="?")
     arg_parser.add_argument("-o", "--orders_output", help="Assembled orders. Defaults to stdout")
     arg_parser.add_argument("-l", "--listing_output", help="Output symbol list to file", required=False)
+    arg_parser.add_argument("-m", "--image_output", help="Output binary memory image to file", required=False)
     arg_parser.add_argument("-a", "--addresses", help="Output memory locations in source as comments", action="store_true", required=False, default=False)
     arg_parser.add_argument("--org", help="Default ORG (origin) location", type=int, required=False, default=Visit.default_org)
+    arg_parser.add_argument("-b", "--batch", help="Assemble every .asm in this directory, skipping unchanged sources", required=False)
+    arg_parser.add_argument("--outdir", help="Output directory for --batch", required=False, default="obj")
+    arg_parser.add_argument("--images", help="With --batch, also write a .img memory image per source", action="store_true", required=False, default=False)
+    arg_parser.add_argument("-O", "--optimize", help="Run the peephole optimizer and report what it saved", action="store_true", required=False, default=False)
+    arg_parser.add_argument("--inner_trips", help="Inner loop trips per outer iteration for the optimizer report, defaults to .const_array_len", type=int, required=False)
+    arg_parser.add_argument("--timings", help="Report startup, parser and per-file times", action="store_true", required=False, default=False)
+    arg_parser.add_argument("-D", "--define", help="Set a def_param, NAME=VALUE", action="append", required=False, default=[])
+    arg_parser.add_argument("--layout", help="Report where the program sits in the store", action="store_true", required=False, default=False)
+    arg_parser.add_argument("--plan", help="Find the largest value of this def_param that fits the store, placing the code at the top", required=False)
+    arg_parser.add_argument("--write_params", help="With --plan, write the planned values back into the source", action="store_true", required=False, default=False)
+    arg_parser.add_argument("--pack", help="Reorder runs of def_num constants to leave out alignment fillers; --plan always packs", action="store_true", required=False, default=False)
 
     args = vars(arg_parser.parse_args(commandline))
     for arg_k, arg_v in args.items():
         logger.debug(f"arg name {arg_k} set to {arg_v}")
-    with open(args["source"], "r") as source_file:
-        source_txt = "".join(source_file.readlines())
 
-    logger.debug("parsing source")
-    ast = edsac_grammar.parse(source_txt)
-    logger.debug(f"ast node count: {len(list(ast.iter_subtrees()))}")
+    params = {}
+    for define in args["define"]:
+        name, _, value = define.partition("=")
+        if not value.lstrip("-").isdigit():
+            arg_parser.error(f"-D {define}: expected NAME=VALUE")
+        params[name.lstrip("$")] = int(value)
+
+    if args["plan"] is not None:
+        if args["source"] is None:
+            arg_parser.error("--plan needs a source")
+        with open(args["source"], "r") as source_file:
+            source_txt = source_file.read()
+        plan = plan_layout(source_txt, args["plan"], params, args["source"])
+        logger.info(f"{args['source']}\n" + plan.report())
+        if args["write_params"]:
+            with open(args["source"], "w") as source_file:
+                source_file.write(write_params(source_txt, plan.params))
+            logger.info(f"parameters written to {args['source']}")
+    elif args["batch"] is not None:
+        assembled = assemble_batch(args["batch"], args["outdir"], args["org"], args["addresses"], timings, args["images"], args["optimize"])
+        logger.info(f"{len(assembled)} sources assembled")
+    elif args["source"] is not None:
+        with open(args["source"], "r") as source_file:
+            source_txt = "".join(source_file.readlines())
+
+        logger.debug("parsing source")
+        orders, symbols, image = assemble(source_txt, args["org"], args["addresses"], timings, args["source"], args["optimize"], args["inner_trips"],
+                                          params, args["pack"], args["layout"])
+
+        outp = args["orders_output"]
+        outlist = args["listing_output"]
+        with (open(outp, "w") if outp else nullcontext(sys.stdout)) as orders_output_stream:
+            orders_output_stream.write(orders)
+        if outlist:
+            with open(outlist, "w") as symbols_listing_stream:
+                symbols_listing_stream.write(symbols)
+        if args["image_output"]:
+            with open(args["image_output"], "wb") as image_stream:
+                image_stream.write(image)
+    else:
+        arg_parser.error("a source or --batch directory is needed")
 
-    outp = args["orders_output"]
-    outlist = args["listing_output"]
-    with (open(outp, "w") if outp else nullcontext()) as orders_output_stream:
-        with (open(outlist, "w") if outlist else nullcontext()) as symbols_listing_string:
-            Visit().visit(
-                ast,
-                org=args["org"],
-                orders_output_stream=orders_output_stream,
-                symbols_listing_stream=symbols_listing_string,
-                emit_location=args["addresses"]
-            )
+    if args["timings"]:
+        logger.info("timings\n" + timings.report())
 
 if __name__ == "__main__":
     main(sys.argv[1:])
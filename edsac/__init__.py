@@ -0,0 +1,9 @@
+# in-process EDSAC emulator for the order listings written by asm/asm.py
+
+from .orders import charset, decode_word, format_order, make_word
+from .loader import Program, load_image, load_listing, load_orders, load_orders_file, load_program
+from .machine import Machine, MachineError
+from .teleprinter import Teleprinter
+from .translate import BlockStats, TranslatingMachine
+from .profiler import Profile, ProfilingMachine, TimingModel
+from .breakpoints import BreakpointMachine
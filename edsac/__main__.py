@@ -0,0 +1,97 @@
+import sys
+import time
+from argparse import ArgumentParser
+
+from loguru import logger
+
+from . import Machine, TranslatingMachine, load_listing, load_program
+from .checkpoint import load_checkpoint, save_checkpoint
+from .profiler import ProfilingMachine, TimingModel
+from .tape import TapeError, TapePunch, TapeReader
+
+
+def main(commandline: list[str]) -> None:
+    arg_parser = ArgumentParser(prog="python -m edsac")
+    arg_parser.add_argument("orders", help="Assembled orders (.e) or memory image (.img), optional with --resume", nargs="?")
+    arg_parser.add_argument("--digits", help="Print only the digits from the teleprinter", action="store_true", default=False)
+    arg_parser.add_argument("--max_orders", help="Stop once this many orders have run in total", type=int, required=False)
+    arg_parser.add_argument("--stats", help="Log orders executed and host time", action="store_true", default=False)
+    arg_parser.add_argument("--interpret", help="Interpret order by order, without block translation", action="store_true", default=False)
+    arg_parser.add_argument("--tape_in", help="Tape file for I orders", required=False)
+    arg_parser.add_argument("--tape_out", help="Tape file punched by O orders", required=False)
+    arg_parser.add_argument("--checkpoint", help="Write a checkpoint here when stopping", required=False)
+    arg_parser.add_argument("--checkpoint_every", help="Also checkpoint every this many orders", type=int, required=False)
+    arg_parser.add_argument("--resume", help="Continue from a checkpoint", required=False)
+    arg_parser.add_argument("--profile", help="Write an order profile to stderr", action="store_true", default=False)
+    arg_parser.add_argument("-l", "--listing", help="Symbol listing from asm.py -l, for profile labels", required=False)
+    arg_parser.add_argument("--order_ms", help="Time of an ordinary order in ms", type=float, default=TimingModel.ordinary_ms)
+    arg_parser.add_argument("--multiply_ms", help="Time of a V/N multiply in ms", type=float, default=TimingModel.multiply_ms)
+
+    args = vars(arg_parser.parse_args(commandline))
+    if args["orders"] is None and args["resume"] is None:
+        arg_parser.error("either orders or --resume is required")
+    if args["profile"]:
+        machine_class = ProfilingMachine
+    elif args["interpret"]:
+        machine_class = Machine
+    else:
+        machine_class = TranslatingMachine
+    program = load_program(args["orders"]) if args["orders"] else None
+    reader = TapeReader(args["tape_in"]) if args["tape_in"] else None
+    # a resumed run punches on after the rows already on its tape
+    punch = TapePunch(args["tape_out"], keep=bool(args["resume"])) if args["tape_out"] else None
+    if args["resume"]:
+        try:
+            machine = load_checkpoint(args["resume"], machine_class, tape=reader, punch=punch)
+        except TapeError as error:
+            arg_parser.error(str(error))
+        logger.info(f"resumed at {machine.pc} after {machine.orders_executed} orders")
+    else:
+        machine = machine_class.from_program(program, tape=reader, punch=punch)
+
+    started = time.perf_counter()
+    orders_at_start = machine.orders_executed
+    if args["digits"]:
+        # digits printed before a resume come first, so the stream is the same as one long run
+        sys.stdout.write("".join(map(str, machine.teleprinter.digits)))
+    while not machine.halted:
+        stop_at = [limit for limit in (args["max_orders"], args["checkpoint_every"] and machine.orders_executed + args["checkpoint_every"]) if limit]
+        stop_at = min(stop_at) if stop_at else None
+        if stop_at is not None and stop_at <= machine.orders_executed:
+            break
+        if args["digits"]:
+            for digit in machine.digits(max_orders=stop_at):
+                sys.stdout.write(str(digit))
+        else:
+            machine.run(max_orders=None if stop_at is None else stop_at - machine.orders_executed)
+        if args["checkpoint"]:
+            save_checkpoint(machine, args["checkpoint"])
+    if args["digits"]:
+        sys.stdout.write("\n")
+    else:
+        sys.stdout.write(machine.teleprinter.printed())
+    sys.stdout.flush()
+    elapsed = time.perf_counter() - started
+
+    for device in (reader, punch):
+        if device is not None:
+            device.close()
+            if args["stats"]:
+                logger.info(device)
+
+    if not machine.halted:
+        logger.warning(f"stopped before halt at {machine.pc}")
+    if args["stats"]:
+        executed = machine.orders_executed - orders_at_start
+        rate = executed / elapsed if elapsed > 0 else 0
+        logger.info(f"{executed} orders in {elapsed:.2f}s ({rate:,.0f} orders/s)")
+        if isinstance(machine, TranslatingMachine):
+            logger.info(machine.stats)
+    if args["profile"]:
+        symbols = load_listing(args["listing"]) if args["listing"] else program.symbols if program else {}
+        timing = TimingModel(ordinary_ms=args["order_ms"], multiply_ms=args["multiply_ms"])
+        print(machine.profile(symbols, timing).report(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
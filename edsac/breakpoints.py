@@ -0,0 +1,61 @@
+from typing import *
+
+from .machine import Machine
+from .orders import make_word
+from .translate import TranslatingMachine
+
+# breakpoints
+#
+# a breakpoint is a stop order planted over the order at its address, so
+# translated blocks end there at full speed and no order pays for a check.
+# on reaching one the machine is left at the breakpoint, not halted, with
+# the planted stop not counted. continuing runs the original order on its
+# own and puts the stop back. planted orders are overwritten by the program
+# itself, so breakpoints belong on ordinary orders, such as a label after a
+# call.
+
+_STOP = make_word("Z")
+
+
+class BreakpointMachine(TranslatingMachine):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.breakpoints: dict[int, int] = {}
+
+    def set_breakpoint(self, addr: int) -> None:
+        if addr in self.breakpoints:
+            return
+        self.breakpoints[addr] = self.mem[addr]
+        self.mem[addr] = _STOP
+        self.invalidate(addr)
+
+    def clear_breakpoint(self, addr: int) -> None:
+        self.mem[addr] = self.breakpoints.pop(addr)
+        self.invalidate(addr)
+
+    def run_to_breakpoint(self, max_orders: Optional[int] = None) -> Optional[int]:
+        "run until a breakpoint, returning its address, or None on a real stop or max_orders"
+        if self.halted:
+            return None
+        executed = 0
+        if self.pc in self.breakpoints:
+            # step the original order past the planted stop
+            addr = self.pc
+            self.mem[addr] = self.breakpoints[addr]
+            try:
+                executed = Machine.run(self, max_orders=1)
+            finally:
+                # an order that stores over itself keeps what it stored
+                self.breakpoints[addr] = self.mem[addr]
+                self.mem[addr] = _STOP
+        if max_orders is not None and executed >= max_orders:
+            return None
+        self.run(max_orders=None if max_orders is None else max_orders - executed)
+        addr = self.pc - 1
+        if self.halted and addr in self.breakpoints:
+            self.halted = False
+            self.pc = addr
+            self.orders_executed -= 1
+            return addr
+        return None
@@ -0,0 +1,79 @@
+import os
+import struct
+from array import array
+from typing import *
+
+from .machine import Machine
+from .orders import MEMSIZE
+
+# machine checkpoints
+#
+#   header   magic, version, pc, halted, orders executed, characters out,
+#            last output, tape position (-1 without a tape reader)
+#   punch    rows punched (-1 without a tape punch), from version 2
+#   acc      71 bit two's complement, 9 bytes
+#   mult     35 bit two's complement, 8 bytes
+#   store    1024 words as uint32, then 512 sandwich digits as bytes
+#   printed  teleprinter codes so far, length prefixed
+
+MAGIC = b"EDSC"
+VERSION = 2
+_header = struct.Struct("<4sHHBQQBq")
+_punch = struct.Struct("<q")
+_mult = struct.Struct("<q")
+_length = struct.Struct("<Q")
+
+
+def save_checkpoint(machine: Machine, path: str) -> None:
+    tape_position = getattr(machine.tape, "position", -1)
+    with open(path + ".tmp", "wb") as checkpoint_file:
+        checkpoint_file.write(_header.pack(
+            MAGIC, VERSION, machine.pc, machine.halted, machine.orders_executed,
+            machine.characters_out, machine.last_output, tape_position,
+        ))
+        checkpoint_file.write(_punch.pack(machine.punch.length if machine.punch is not None else -1))
+        checkpoint_file.write(machine.acc.to_bytes(9, "little", signed=True))
+        checkpoint_file.write(_mult.pack(machine.mult))
+        array("I", machine.mem).tofile(checkpoint_file)
+        checkpoint_file.write(bytes(machine.sandwich))
+        codes = bytes(machine.teleprinter.codes)
+        checkpoint_file.write(_length.pack(len(codes)))
+        checkpoint_file.write(codes)
+    # replace the previous checkpoint only once this one is complete
+    os.replace(path + ".tmp", path)
+
+
+def load_checkpoint(path: str, machine_class: type = Machine, tape=None, punch=None) -> Machine:
+    "rebuild a machine from a checkpoint; each call gives an independent machine to fork experiments from"
+    with open(path, "rb") as checkpoint_file:
+        magic, version, pc, halted, orders_executed, characters_out, last_output, tape_position = \
+            _header.unpack(checkpoint_file.read(_header.size))
+        if magic != MAGIC or not 1 <= version <= VERSION:
+            raise ValueError(f"{path} is not an emulator checkpoint")
+        (punch_length,) = _punch.unpack(checkpoint_file.read(_punch.size)) if version >= 2 else (-1,)
+        acc = int.from_bytes(checkpoint_file.read(9), "little", signed=True)
+        (mult,) = _mult.unpack(checkpoint_file.read(_mult.size))
+        mem = array("I")
+        mem.fromfile(checkpoint_file, MEMSIZE)
+        sandwich = checkpoint_file.read(MEMSIZE // 2)
+        (printed,) = _length.unpack(checkpoint_file.read(_length.size))
+        codes = checkpoint_file.read(printed)
+
+    machine = machine_class(list(mem), pc, tape, punch)
+    # the initial orders residue is part of the saved store
+    machine.mem[:] = mem
+    machine.sandwich[:] = sandwich
+    machine.acc = acc
+    machine.mult = mult
+    machine.halted = bool(halted)
+    machine.orders_executed = orders_executed
+    machine.characters_out = characters_out
+    machine.last_output = last_output
+    for code in codes:
+        machine.teleprinter.punch(code)
+    if tape is not None and tape_position >= 0:
+        tape.position = tape_position
+    if punch is not None:
+        # a punch opened with keep=True carries on after the rows punched before the checkpoint
+        punch.wind_to(max(punch_length, 0))
+    return machine
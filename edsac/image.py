@@ -0,0 +1,61 @@
+import struct
+from array import array
+from typing import *
+
+# memory images, written by asm.py -m and read by load_image
+#
+#   header   magic, version, start address (0xffff when none), store words,
+#            symbol count
+#   loaded   one bit per word, set where the loader would place an order
+#   store    words as uint32, 17 bits used
+#   symbols  address, name length, utf-8 name; in listing order
+
+IMAGE_MAGIC = b"EDSI"
+IMAGE_VERSION = 1
+IMAGE_NO_START = 0xFFFF
+_image_header = struct.Struct("<4sHHHH")
+_image_symbol = struct.Struct("<HB")
+
+
+def pack_image(mem: list[int], loaded: set[int], start: Optional[int], symbols: dict[str, int]) -> bytes:
+    "the image bytes for a store, the words placed in it, start address and symbols"
+    loaded_bits = bytearray(len(mem) // 8)
+    for addr in loaded:
+        loaded_bits[addr >> 3] |= 1 << (addr & 7)
+    symbol_bytes = bytearray()
+    for label, addr in symbols.items():
+        name = label.encode()
+        symbol_bytes += _image_symbol.pack(addr, len(name)) + name
+    header = _image_header.pack(
+        IMAGE_MAGIC, IMAGE_VERSION, IMAGE_NO_START if start is None else start, len(mem), len(symbols),
+    )
+    return header + bytes(loaded_bits) + array("I", mem).tobytes() + bytes(symbol_bytes)
+
+
+def unpack_image(data: bytes) -> tuple[list[int], set[int], Optional[int], dict[str, int]]:
+    "(store, placed words, start address, symbols) from image bytes"
+    magic, version, start, words, symbol_count = _image_header.unpack_from(data)
+    if magic != IMAGE_MAGIC or version != IMAGE_VERSION:
+        raise ValueError("not an EDSAC memory image")
+    offset = _image_header.size
+    loaded = data[offset:offset + words // 8]
+    offset += words // 8
+    mem = array("I")
+    mem.frombytes(data[offset:offset + 4 * words])
+    offset += 4 * words
+    symbols = {}
+    for _ in range(symbol_count):
+        addr, length = _image_symbol.unpack_from(data, offset)
+        offset += _image_symbol.size
+        symbols[data[offset:offset + length].decode()] = addr
+        offset += length
+    return (
+        mem.tolist(),
+        {addr for addr in range(words) if loaded[addr >> 3] >> (addr & 7) & 1},
+        None if start == IMAGE_NO_START else start,
+        symbols,
+    )
+
+
+def is_image(data: bytes) -> bool:
+    return data.startswith(IMAGE_MAGIC)
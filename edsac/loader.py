@@ -0,0 +1,106 @@
+import re
+from dataclasses import dataclass, field
+from typing import *
+
+from .image import is_image, unpack_image
+from .orders import MEMSIZE, code_values, make_word
+
+# reads the textual order listings (.e files) written by asm/asm.py,
+# doing the work of punch and initial orders 2 in one step, and the
+# binary memory images (asm.py -m), which need no parsing at all
+
+_location = re.compile(r"^\[\d+\]")
+_symbol_hint = re.compile(r"\s\[([^\]]*)\]\s*$")
+_order = re.compile(r"^(\S)\s*(\d*)\s*(#?)\s*([A-Z@!&#*.])$")
+
+@dataclass
+class Program:
+    mem: list[int] = field(default_factory=lambda: [0] * MEMSIZE)
+    start: Optional[int] = None
+    loaded: set[int] = field(default_factory=set)
+    symbols: dict[str, int] = field(default_factory=dict)
+
+
+def parse_order(line: str) -> Optional[tuple[str, int, bool, str]]:
+    "split an order line into (code, param, pi, terminator), None for blank tape"
+    line = _symbol_hint.sub("", _location.sub("", line.strip())).strip()
+    if line in ("", "."):
+        return None
+    match = _order.match(line)
+    if match is None:
+        raise ValueError(f"unrecognised order line {line!r}")
+    code, param, pi, term = match.groups()
+    return code, int(param or 0), pi == "#", term
+
+
+def load_orders(lines: Iterable[str]) -> Program:
+    program = Program()
+    load_addr = 0
+    expect_launch = False
+    for line_no, line in enumerate(lines, 1):
+        hint = _symbol_hint.search(line)
+        order = parse_order(line)
+        if order is None:
+            continue
+        code, param, pi, term = order
+        if expect_launch:
+            # the "P F" following "E n K" is the accumulator, not an order
+            expect_launch = False
+            continue
+        if term in ("K", "Z"):
+            match code:
+                case "T":
+                    load_addr = param
+                case "E":
+                    program.start = param
+                    expect_launch = True
+                case "P":
+                    pass
+                case _:
+                    raise ValueError(f"line {line_no}: unsupported control combination {code} {param} {term}")
+            continue
+        if term not in ("F", "D"):
+            raise ValueError(f"line {line_no}: unsupported terminator {term}")
+        if code not in code_values:
+            raise ValueError(f"line {line_no}: unknown order code {code}")
+        if load_addr >= MEMSIZE:
+            raise ValueError(f"line {line_no}: load address {load_addr} beyond store")
+        # "#" (pi) marks the length bit like D
+        program.mem[load_addr] = make_word(code, param, term == "D" or pi)
+        program.loaded.add(load_addr)
+        if hint is not None:
+            program.symbols[hint.group(1)] = load_addr
+        load_addr += 1
+    return program
+
+
+def load_orders_file(path: str) -> Program:
+    with open(path, "r") as orders_file:
+        return load_orders(orders_file)
+
+
+def load_image(data: bytes) -> Program:
+    mem, loaded, start, symbols = unpack_image(data)
+    if len(mem) != MEMSIZE:
+        raise ValueError(f"image of {len(mem)} words, store has {MEMSIZE}")
+    return Program(mem=mem, start=start, loaded=loaded, symbols=symbols)
+
+
+def load_program(path: str) -> Program:
+    "a memory image or an order listing, whichever the file holds"
+    with open(path, "rb") as program_file:
+        data = program_file.read()
+    if is_image(data):
+        return load_image(data)
+    return load_orders(data.decode().splitlines())
+
+
+def load_listing(path: str) -> dict[str, int]:
+    "read a symbol listing written by asm.py -l"
+    symbols = {}
+    with open(path, "r") as listing_file:
+        for line in listing_file:
+            if line.strip():
+                label, addr = line.split()
+                symbols[label] = int(addr)
+    return symbols
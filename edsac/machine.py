@@ -0,0 +1,224 @@
+from typing import *
+
+from .orders import *
+from .teleprinter import Teleprinter
+
+# accumulator holds a 71 bit two's complement fraction, kept here as a
+# signed python int in units of 2^-70; short words enter at the top
+# 17 bits and long words at the top 35 bits.
+# the multiplier register holds 35 bits in units of 2^-34.
+
+_SHORT_SHIFT = ACC_BITS - SHORT_BITS
+_LONG_SHIFT = ACC_BITS - LONG_BITS
+_ACC_HALF = 1 << (ACC_BITS - 1)
+_ACC_MASK = (1 << ACC_BITS) - 1
+_ROUND_BIT = 1 << (_LONG_SHIFT - 1)
+
+# location 3 keeps "U 2 F" after initial orders 2 have read the tape,
+# subroutine entry "A 3 F" relies on it to build the return jump
+initial_orders_residue = {3: make_word("U", 2)}
+
+
+class MachineError(Exception):
+    pass
+
+
+class Machine:
+
+    def __init__(self, mem: Optional[list[int]] = None, start: int = 0, tape: Optional[Iterable[int]] = None, punch=None):
+        self.mem: list[int] = [0] * MEMSIZE
+        for addr, word in initial_orders_residue.items():
+            self.mem[addr] = word
+        if mem is not None:
+            for addr, word in enumerate(mem):
+                if word:
+                    self.mem[addr] = word
+        self.sandwich: list[int] = [0] * (MEMSIZE // 2)
+        self.acc = 0
+        self.mult = 0
+        self.pc = start
+        self.halted = False
+        self.orders_executed = 0
+        self.teleprinter = Teleprinter()
+        self.tape = iter(tape) if tape is not None else iter(())
+        # output goes to the teleprinter, and to a tape punch when attached
+        self.punch = punch
+        self.echo = True
+        self.characters_out = 0
+        self.last_output = 0
+        # called with the address of every word run() stores into, for
+        # subclasses caching anything derived from the store
+        self.store_hook: Optional[Callable[[int], None]] = None
+
+    @classmethod
+    def from_program(cls, program, tape: Optional[Iterable[int]] = None, punch=None) -> "Machine":
+        if program.start is None:
+            raise MachineError("program has no start address")
+        return cls(program.mem, program.start, tape, punch)
+
+    def output(self, code: int) -> None:
+        self.characters_out += 1
+        self.last_output = code
+        if self.punch is not None:
+            self.punch.punch(code)
+        if self.echo:
+            self.teleprinter.punch(code)
+
+    # store access for tools that inspect the machine
+
+    def read_short(self, addr: int) -> int:
+        return signed_short(self.mem[addr])
+
+    def read_long(self, addr: int) -> int:
+        addr &= ~1
+        word = (self.mem[addr + 1] << 18) | (self.sandwich[addr >> 1] << 17) | self.mem[addr]
+        return signed_long(word)
+
+    def write_short(self, addr: int, value: int) -> None:
+        self.mem[addr] = value & SHORT_MASK
+
+    def write_long(self, addr: int, value: int) -> None:
+        addr &= ~1
+        value &= LONG_MASK
+        self.mem[addr] = value & SHORT_MASK
+        self.sandwich[addr >> 1] = (value >> 17) & 1
+        self.mem[addr + 1] = value >> 18
+
+    def step(self) -> None:
+        self.run(max_orders=1)
+
+    def run(self, max_orders: Optional[int] = None, stop_on_output: bool = False) -> int:
+        "execute orders until stop, max_orders or (optionally) the next output; returns orders executed"
+        if self.halted:
+            return 0
+        mem = self.mem
+        sandwich = self.sandwich
+        decode = decode_table
+        output = self.output
+        stored = self.store_hook
+        acc = self.acc
+        mult = self.mult
+        pc = self.pc
+        limit = max_orders if max_orders is not None else -1
+        count = 0
+        try:
+            while count != limit:
+                op, n, long = decode[mem[pc]]
+                pc += 1
+                count += 1
+                if op == OP_A:
+                    if long:
+                        w = (mem[n + 1] << 18) | (sandwich[n >> 1] << 17) | mem[n]
+                        acc += (w - ((w & 0x400000000) << 1)) << _LONG_SHIFT
+                    else:
+                        w = mem[n]
+                        acc += (w - ((w & 0x10000) << 1)) << _SHORT_SHIFT
+                    if not -_ACC_HALF <= acc < _ACC_HALF:
+                        acc = ((acc + _ACC_HALF) & _ACC_MASK) - _ACC_HALF
+                elif op == OP_T or op == OP_U:
+                    if long:
+                        w = (acc >> _LONG_SHIFT) & LONG_MASK
+                        mem[n] = w & SHORT_MASK
+                        sandwich[n >> 1] = (w >> 17) & 1
+                        mem[n + 1] = w >> 18
+                    else:
+                        mem[n] = (acc >> _SHORT_SHIFT) & SHORT_MASK
+                    if stored is not None:
+                        stored(n)
+                        if long:
+                            stored(n + 1)
+                    if op == OP_T:
+                        acc = 0
+                elif op == OP_S:
+                    if long:
+                        w = (mem[n + 1] << 18) | (sandwich[n >> 1] << 17) | mem[n]
+                        acc -= (w - ((w & 0x400000000) << 1)) << _LONG_SHIFT
+                    else:
+                        w = mem[n]
+                        acc -= (w - ((w & 0x10000) << 1)) << _SHORT_SHIFT
+                    if not -_ACC_HALF <= acc < _ACC_HALF:
+                        acc = ((acc + _ACC_HALF) & _ACC_MASK) - _ACC_HALF
+                elif op == OP_E:
+                    if acc >= 0:
+                        pc = n
+                elif op == OP_G:
+                    if acc < 0:
+                        pc = n
+                elif op == OP_L:
+                    acc <<= n
+                    if not -_ACC_HALF <= acc < _ACC_HALF:
+                        acc = ((acc + _ACC_HALF) & _ACC_MASK) - _ACC_HALF
+                elif op == OP_R:
+                    acc >>= n
+                elif op == OP_H:
+                    if long:
+                        w = (mem[n + 1] << 18) | (sandwich[n >> 1] << 17) | mem[n]
+                        mult = w - ((w & 0x400000000) << 1)
+                    else:
+                        w = mem[n]
+                        mult = (w - ((w & 0x10000) << 1)) << 18
+                elif op == OP_V or op == OP_N:
+                    if long:
+                        w = (mem[n + 1] << 18) | (sandwich[n >> 1] << 17) | mem[n]
+                        product = ((w - ((w & 0x400000000) << 1)) * mult) << 2
+                    else:
+                        w = mem[n]
+                        product = (((w - ((w & 0x10000) << 1)) << 18) * mult) << 2
+                    if op == OP_V:
+                        acc += product
+                    else:
+                        acc -= product
+                    if not -_ACC_HALF <= acc < _ACC_HALF:
+                        acc = ((acc + _ACC_HALF) & _ACC_MASK) - _ACC_HALF
+                elif op == OP_C:
+                    if long:
+                        w = (mem[n + 1] << 18) | (sandwich[n >> 1] << 17) | mem[n]
+                        w &= mult & LONG_MASK
+                        acc += (w - ((w & 0x400000000) << 1)) << _LONG_SHIFT
+                    else:
+                        w = mem[n] & ((mult >> 18) & SHORT_MASK)
+                        acc += (w - ((w & 0x10000) << 1)) << _SHORT_SHIFT
+                    if not -_ACC_HALF <= acc < _ACC_HALF:
+                        acc = ((acc + _ACC_HALF) & _ACC_MASK) - _ACC_HALF
+                elif op == OP_O:
+                    output(mem[n] >> 12)
+                    if stop_on_output:
+                        break
+                elif op == OP_I:
+                    mem[n] = next(self.tape, 0) & 0x1F
+                    if stored is not None:
+                        stored(n)
+                elif op == OP_F:
+                    mem[n] = self.last_output << 12
+                    if stored is not None:
+                        stored(n)
+                elif op == OP_Y:
+                    acc += _ROUND_BIT
+                    if not -_ACC_HALF <= acc < _ACC_HALF:
+                        acc = ((acc + _ACC_HALF) & _ACC_MASK) - _ACC_HALF
+                elif op == OP_X:
+                    pass
+                elif op == OP_Z:
+                    self.halted = True
+                    break
+                else:
+                    raise MachineError(f"invalid order {format_order(mem[pc - 1])} at {pc - 1}")
+        finally:
+            self.acc = acc
+            self.mult = mult
+            self.pc = pc
+            self.orders_executed += count
+        return count
+
+    def digits(self, max_orders: Optional[int] = None) -> Iterator[int]:
+        "run the program, yielding each digit as it is printed"
+        printed = self.teleprinter.digits
+        released = len(printed)
+        while not self.halted:
+            budget = None if max_orders is None else max_orders - self.orders_executed
+            if budget is not None and budget <= 0:
+                break
+            self.run(max_orders=budget, stop_on_output=True)
+            while released < len(printed):
+                yield printed[released]
+                released += 1
@@ -0,0 +1,87 @@
+from typing import *
+
+# EDSAC order and number formats
+#
+# a short word is 17 bits: 5 bit function code, 1 unused bit,
+# 10 bit address and the length bit (0 = F, 1 = D)
+#
+# a long word at an even address n is 35 bits:
+# mem[n + 1] (17 bits) | sandwich digit | mem[n] (17 bits)
+
+charset = "PQWERTYUIOJ#SZK*.F@D!HNM&LXGABCV"
+code_values: dict[str, int] = {c: i for i, c in enumerate(charset)}
+
+SHORT_BITS = 17
+LONG_BITS = 35
+ACC_BITS = 71
+MEMSIZE = 1024
+
+SHORT_MASK = (1 << SHORT_BITS) - 1
+LONG_MASK = (1 << LONG_BITS) - 1
+
+# order codes by function letter
+OP_A = code_values["A"]  # add
+OP_S = code_values["S"]  # subtract
+OP_H = code_values["H"]  # copy to multiplier
+OP_V = code_values["V"]  # multiply and add
+OP_N = code_values["N"]  # multiply and subtract
+OP_T = code_values["T"]  # transfer and clear
+OP_U = code_values["U"]  # transfer
+OP_C = code_values["C"]  # collate with multiplier
+OP_R = code_values["R"]  # shift right
+OP_L = code_values["L"]  # shift left
+OP_E = code_values["E"]  # jump if acc >= 0
+OP_G = code_values["G"]  # jump if acc < 0
+OP_I = code_values["I"]  # read tape
+OP_O = code_values["O"]  # teleprinter output
+OP_F = code_values["F"]  # verify last output
+OP_X = code_values["X"]  # no operation
+OP_Y = code_values["Y"]  # round
+OP_Z = code_values["Z"]  # stop
+
+valid_ops = frozenset({
+    OP_A, OP_S, OP_H, OP_V, OP_N, OP_T, OP_U, OP_C, OP_R,
+    OP_L, OP_E, OP_G, OP_I, OP_O, OP_F, OP_X, OP_Y, OP_Z,
+})
+
+
+def make_word(order_code: str, order_param: int = 0, long: bool = False) -> int:
+    "pack an order into a 17 bit word"
+    return (code_values[order_code] << 12) | ((order_param << 1) & 0xFFF) | int(long)
+
+
+def shift_places(word: int) -> int:
+    "R and L shift by one more than the position of the least significant 1 in the order"
+    return (word & -word).bit_length()
+
+
+def decode_word(word: int) -> tuple[int, int, int]:
+    "split a word into (op, address, long); shift orders carry their shift count as address"
+    op = word >> 12
+    if op == OP_L or op == OP_R:
+        return op, shift_places(word), 0
+    long = word & 1
+    address = (word >> 1) & (MEMSIZE - 1)
+    if long:
+        address &= ~1
+    return op, address, long
+
+
+# every 17 bit word decoded once, so fetches never decode and
+# planted (self-modified) orders need no invalidation
+decode_table: list[tuple[int, int, int]] = [decode_word(w) for w in range(1 << SHORT_BITS)]
+
+
+def signed_short(word: int) -> int:
+    return word - ((word & 0x10000) << 1)
+
+
+def signed_long(word: int) -> int:
+    return word - ((word & (1 << 34)) << 1)
+
+
+def format_order(word: int) -> str:
+    "render a word the way the assembler lists it"
+    param = (word >> 1) & 0x7FF
+    param_repr = f"{param: 5d}" if param != 0 else ""
+    return f"{charset[word >> 12]} {param_repr:5}  {'D' if word & 1 else 'F'}"
@@ -0,0 +1,224 @@
+from bisect import bisect_right
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import *
+
+from .machine import Machine
+from .orders import *
+from .translate import Block, TranslatingMachine
+
+# order-level profiling
+#
+# translated blocks record how many of their orders ran on each exit, so
+# per-address counts are rebuilt afterwards without slowing the blocks.
+# orders the translator interprets are counted one at a time.
+
+
+@dataclass
+class TimingModel:
+    "historical order times in milliseconds"
+    ordinary_ms: float = 1.5
+    multiply_ms: float = 6.0
+    # teleprinter and mechanical tape reader at 6 2/3 characters per second
+    output_ms: float = 150.0
+    input_ms: float = 150.0
+
+    def order_ms(self, op: int) -> float:
+        if op == OP_V or op == OP_N:
+            return self.multiply_ms
+        if op == OP_O:
+            return self.output_ms
+        if op == OP_I:
+            return self.input_ms
+        return self.ordinary_ms
+
+
+@dataclass
+class ProcRange:
+    name: str
+    entry: int
+    ret: int
+
+    def __contains__(self, addr: int) -> bool:
+        return self.entry <= addr <= self.ret
+
+
+def find_procs(symbols: dict[str, int]) -> list[ProcRange]:
+    "def_proc ranges: from the entry label to its %return% slot"
+    procs = []
+    for label, addr in symbols.items():
+        ret = symbols.get("%return%" + label)
+        if ret is not None and not label.startswith("%return%"):
+            procs.append(ProcRange(label, addr, ret))
+    return sorted(procs, key=lambda proc: proc.entry)
+
+
+@dataclass
+class Profile:
+    counts: Counter = field(default_factory=Counter)  # (addr, op) -> executions
+    timing: TimingModel = field(default_factory=TimingModel)
+    symbols: dict[str, int] = field(default_factory=dict)
+    mem: list[int] = field(default_factory=list)
+
+    def __post_init__(self):
+        labelled = sorted((addr, label) for label, addr in self.symbols.items() if not label.startswith("%return%"))
+        self._label_addrs = [addr for addr, _ in labelled]
+        self._labels = [label for _, label in labelled]
+        self.procs = find_procs(self.symbols)
+
+    @property
+    def orders(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def machine_ms(self) -> float:
+        return sum(count * self.timing.order_ms(op) for (_, op), count in self.counts.items())
+
+    def label_of(self, addr: int) -> str:
+        index = bisect_right(self._label_addrs, addr) - 1
+        if index < 0:
+            return ""
+        offset = addr - self._label_addrs[index]
+        return self._labels[index] + (f"+{offset}" if offset else "")
+
+    def proc_of(self, addr: int) -> str:
+        inside = [proc for proc in self.procs if addr in proc]
+        if not inside:
+            return "(none)"
+        return min(inside, key=lambda proc: proc.ret - proc.entry).name
+
+    def by_code(self) -> Counter:
+        codes = Counter()
+        for (_, op), count in self.counts.items():
+            codes[charset[op]] += count
+        return codes
+
+    def by_proc(self) -> dict[str, tuple[int, float]]:
+        procs: dict[str, tuple[int, float]] = {}
+        for (addr, op), count in self.counts.items():
+            name = self.proc_of(addr)
+            orders, ms = procs.get(name, (0, 0.0))
+            procs[name] = (orders + count, ms + count * self.timing.order_ms(op))
+        return procs
+
+    def calls(self) -> list[tuple[str, int, list[tuple[int, str, int]]]]:
+        "(proc, calls, [(site, caller, count)]) from entry counts and the G orders that reach it"
+        entry_counts = Counter()
+        for (addr, _), count in self.counts.items():
+            entry_counts[addr] += count
+        table = []
+        for proc in self.procs:
+            sites = []
+            for (addr, op), count in self.counts.items():
+                if op == OP_G and decode_table[self.mem[addr]][1] == proc.entry:
+                    sites.append((addr, self.proc_of(addr), count))
+            table.append((proc.name, entry_counts[proc.entry], sorted(sites)))
+        return table
+
+    def report(self, top: int = 25) -> str:
+        total_ms = self.machine_ms
+        orders = self.orders
+        lines = [
+            f"orders executed: {orders}",
+            f"estimated EDSAC time: {format_duration(total_ms)} ({total_ms / 3_600_000:.2f} hours)",
+            "",
+            "flat profile",
+            f"{'addr':>5} {'order':<14} {'count':>12} {'time':>12} {'%':>6}  label",
+        ]
+        per_addr = Counter()
+        for (addr, op), count in self.counts.items():
+            per_addr[addr] += count * self.timing.order_ms(op)
+        for addr, ms in per_addr.most_common(top):
+            count = sum(c for (a, _), c in self.counts.items() if a == addr)
+            lines.append(
+                f"{addr:5d} {format_order(self.mem[addr]):<14} {count:12d} "
+                f"{format_duration(ms):>12} {100 * ms / total_ms:6.2f}  {self.label_of(addr)}"
+            )
+        lines += ["", "by order code", f"{'code':>5} {'count':>12} {'time':>12}"]
+        for code, count in self.by_code().most_common():
+            ms = count * self.timing.order_ms(code_values[code])
+            lines.append(f"{code:>5} {count:12d} {format_duration(ms):>12}")
+        lines += ["", "by def_proc", f"{'proc':<24} {'orders':>12} {'time':>12} {'%':>6}"]
+        for name, (count, ms) in sorted(self.by_proc().items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<24} {count:12d} {format_duration(ms):>12} {100 * ms / total_ms:6.2f}")
+        lines += ["", "call counts", f"{'proc':<24} {'calls':>10}  sites"]
+        for name, calls, sites in self.calls():
+            site_repr = ", ".join(f"{site} in {caller} x{count}" for site, caller, count in sites)
+            lines.append(f"{name:<24} {calls:10d}  {site_repr}")
+        return "\n".join(lines)
+
+
+def format_duration(ms: float) -> str:
+    seconds = ms / 1000
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(hours)}:{int(minutes):02d}:{seconds:06.3f}"
+
+
+class ProfilingMachine(TranslatingMachine):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiled_blocks: list[Block] = []
+        self.block_exits: dict[int, Counter] = {}
+        self.interpreted_counts: Counter = Counter()
+
+    def translate(self, start: int) -> Optional[Block]:
+        block = super().translate(start)
+        if block is not None:
+            # keep invalidated blocks alive so their ids stay unique
+            self.profiled_blocks.append(block)
+            self.block_exits[id(block)] = Counter()
+        return block
+
+    def run(self, max_orders: Optional[int] = None, stop_on_output: bool = False) -> int:
+        "as TranslatingMachine.run, recording block exits and interpreting one order at a time"
+        if self.halted:
+            return 0
+        blocks = self.blocks
+        stats = self.stats
+        limit = max_orders if max_orders is not None else 1 << 62
+        count = 0
+        block_count = 0
+        try:
+            while count < limit and not self.halted:
+                pc = self.pc
+                block = blocks[pc]
+                if block is None:
+                    block = self.translate(pc)
+                else:
+                    stats.hits += 1
+                if block is None or count + block.length > limit:
+                    word = self.mem[pc]
+                    printed = self.characters_out
+                    executed = Machine.run(self, max_orders=1, stop_on_output=stop_on_output)
+                    if executed == 0:
+                        break
+                    count += 1
+                    stats.interpreted += 1
+                    self.interpreted_counts[(pc, word >> 12)] += 1
+                    if stop_on_output and self.characters_out != printed:
+                        break
+                    continue
+                self.pc, self.acc, self.mult, executed = block.fn(self.acc, self.mult, limit - count)
+                self.block_exits[id(block)][executed] += 1
+                count += executed
+                block_count += executed
+                if stop_on_output and block.output and executed == block.length:
+                    break
+        finally:
+            self.orders_executed += block_count
+            stats.block_orders += block_count
+        return count
+
+    def profile(self, symbols: Optional[dict[str, int]] = None, timing: Optional[TimingModel] = None) -> Profile:
+        counts = Counter(self.interpreted_counts)
+        for block in self.profiled_blocks:
+            length = block.length
+            for executed, times in self.block_exits[id(block)].items():
+                passes, rest = divmod(executed, length) if block.loop else (0, executed)
+                for index, (addr, op, _, _) in enumerate(block.orders):
+                    ran = passes * times + (times if index < rest else 0)
+                    if ran:
+                        counts[(addr, op)] += ran
+        return Profile(counts, timing or TimingModel(), symbols or {}, list(self.mem))
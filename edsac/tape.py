@@ -0,0 +1,138 @@
+import mmap
+import os
+from dataclasses import dataclass
+from typing import *
+
+# paper tape devices
+#
+# a tape file holds one byte per row of 5 hole tape. files are memory
+# mapped so long intermediate tapes are never copied into python objects.
+# each device keeps the machine time it has spent moving tape.
+
+ROWS_PER_METRE = 10 / 0.0254  # 10 rows to the inch
+
+
+@dataclass
+class TapeTiming:
+    "rows per second and the cost of getting a tape back to its start"
+    # photoelectric reader, and the teleprinter punch at 6 2/3 characters per second
+    reader_cps: float = 50.0
+    punch_cps: float = 20.0 / 3.0
+    # rewinding by hand, plus the operator re-feeding the tape
+    rewind_cps: float = 500.0
+    refeed_s: float = 30.0
+
+
+class TapeError(Exception):
+    pass
+
+
+class TapeReader:
+    "feeds rows of a tape file to I orders"
+
+    def __init__(self, path: str, timing: Optional[TapeTiming] = None):
+        self.path = path
+        self.timing = timing or TapeTiming()
+        self.position = 0
+        self.rows_read = 0
+        self.feeds = 1
+        self.busy_s = 0.0
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.length = size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> int:
+        if self.position >= self.length:
+            raise StopIteration
+        row = self._map[self.position]
+        self.position += 1
+        self.rows_read += 1
+        self.busy_s += 1 / self.timing.reader_cps
+        return row
+
+    def rewind(self) -> None:
+        "wind the tape back and feed it through the reader again"
+        self.busy_s += self.position / self.timing.rewind_cps + self.timing.refeed_s
+        self.position = 0
+        self.feeds += 1
+
+    @property
+    def metres(self) -> float:
+        return self.rows_read / ROWS_PER_METRE
+
+    def close(self) -> None:
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __str__(self):
+        return (
+            f"reader {self.path}: {self.rows_read} rows ({self.metres:.1f} m), "
+            f"{self.feeds} feeds, {self.busy_s:.1f}s"
+        )
+
+
+class TapePunch:
+    "punches rows from O orders into a tape file, growing the mapping as needed"
+
+    initial_rows = 1 << 16
+
+    def __init__(self, path: str, timing: Optional[TapeTiming] = None, keep: bool = False):
+        "keep opens an existing tape without blanking it, for a resumed run to wind on with wind_to"
+        self.path = path
+        self.timing = timing or TapeTiming()
+        self.length = 0
+        self.busy_s = 0.0
+        self._file = open(path, "r+b" if keep and os.path.exists(path) else "w+b")
+        self.kept_rows = os.fstat(self._file.fileno()).st_size
+        self._capacity = max(self.initial_rows, self.kept_rows)
+        self._file.truncate(self._capacity)
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+
+    def punch(self, row: int) -> None:
+        if self._map is None:
+            raise TapeError(f"punch {self.path} is closed")
+        if self.length == self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._map.resize(self._capacity)
+        self._map[self.length] = row & 0x1F
+        self.length += 1
+        self.busy_s += 1 / self.timing.punch_cps
+
+    def wind_to(self, length: int) -> None:
+        "carry on punching after the first length rows of a kept tape"
+        if length > self.kept_rows:
+            raise TapeError(f"punch {self.path} has {self.kept_rows} rows, {length} were punched before the checkpoint")
+        self.length = length
+
+    @property
+    def metres(self) -> float:
+        return self.length / ROWS_PER_METRE
+
+    def close(self) -> None:
+        "trim the file to the rows punched"
+        if self._map is None:
+            return
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(self.length)
+        self._file.close()
+
+    def reader(self) -> TapeReader:
+        "tear off the tape and load it in the reader"
+        self.close()
+        return TapeReader(self.path, self.timing)
+
+    def __str__(self):
+        return f"punch {self.path}: {self.length} rows ({self.metres:.1f} m), {self.busy_s:.1f}s"
+
+
+def write_tape(path: str, rows: Iterable[int]) -> None:
+    with open(path, "wb") as tape_file:
+        tape_file.write(bytes(row & 0x1F for row in rows))
@@ -0,0 +1,41 @@
+from typing import *
+
+from .orders import charset
+
+# teleprinter character sets, indexed by 5 bit code
+# figure shift is "#" (11), letter shift is "*" (15), "." (16) is blank tape
+_letters = charset.replace("@", "\r").replace("!", " ").replace("&", "\n")
+_figures = "0123456789?#\"+(*.$\r; £,.\n)/#-?:="
+
+FIGURE_SHIFT = charset.index("#")
+LETTER_SHIFT = charset.index("*")
+BLANK = charset.index(".")
+
+
+class Teleprinter:
+    "collects output characters and decodes them with the current shift"
+
+    def __init__(self):
+        self.codes = bytearray()
+        self.figures = False
+        self.digits = bytearray()
+        self.text: list[str] = []
+
+    def punch(self, code: int) -> None:
+        self.codes.append(code)
+        if code == FIGURE_SHIFT:
+            self.figures = True
+        elif code == LETTER_SHIFT:
+            self.figures = False
+        elif code != BLANK:
+            char = (_figures if self.figures else _letters)[code]
+            self.text.append(char)
+            if self.figures and code < 10:
+                self.digits.append(code)
+
+    @property
+    def last(self) -> int:
+        return self.codes[-1] if self.codes else 0
+
+    def printed(self) -> str:
+        return "".join(self.text).replace("\r", "")
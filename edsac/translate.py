@@ -0,0 +1,298 @@
+from dataclasses import dataclass
+from typing import *
+
+from .machine import Machine, _ACC_HALF, _ACC_MASK, _LONG_SHIFT, _ROUND_BIT, _SHORT_SHIFT
+from .orders import *
+
+# basic-block translation
+#
+# straight-line runs of orders are turned into python functions and cached
+# by start address. a block runs on through conditional jumps (side exits)
+# and ends at a jump known to be taken, an output, a stop or a store that
+# lands further on in the block. a block that jumps back to its own start
+# and never stores into itself is compiled as a loop.
+#
+# stores check whether the target is covered by a cached block and drop
+# every block covering it, interpreted stores through Machine.store_hook.
+# addresses that keep getting overwritten, like the planted orders in
+# pi_mem.asm, are marked volatile and interpreted one order at a time so
+# the blocks around them stay cached.
+
+MAX_BLOCK = 64
+VOLATILE_AFTER = 4
+_UNLIMITED = 1 << 62
+
+_wrap = f"if not {-_ACC_HALF} <= acc < {_ACC_HALF}: acc = ((acc + {_ACC_HALF}) & {_ACC_MASK}) - {_ACC_HALF}"
+
+
+@dataclass
+class Block:
+    start: int
+    end: int
+    length: int
+    fn: Callable
+    output: bool
+    loop: bool
+    source: str
+    orders: list[tuple[int, int, int, int]]
+
+
+@dataclass
+class BlockStats:
+    hits: int = 0
+    translations: int = 0
+    invalidations: int = 0
+    interpreted: int = 0
+    block_orders: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        dispatches = self.hits + self.translations
+        return self.hits / dispatches if dispatches else 0.0
+
+    def __str__(self):
+        return (
+            f"blocks: {self.hits} hits, {self.translations} translations "
+            f"({self.hit_rate:.2%} hit rate), {self.invalidations} invalidations, "
+            f"{self.interpreted} orders interpreted, {self.block_orders} orders in blocks"
+        )
+
+
+class TranslatingMachine(Machine):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.blocks: list[Optional[Block]] = [None] * MEMSIZE
+        self.covering: list[set[int]] = [set() for _ in range(MEMSIZE)]
+        self.rewrites = [0] * MEMSIZE
+        self.volatile = [False] * MEMSIZE
+        self.stats = BlockStats()
+        # orders interpreted outside a block, near the end of a budget or
+        # stepped by a subclass, drop the blocks they store into as well
+        self.store_hook = self.invalidate
+
+    def write_short(self, addr: int, value: int) -> None:
+        super().write_short(addr, value)
+        self.invalidate(addr)
+
+    def write_long(self, addr: int, value: int) -> None:
+        super().write_long(addr, value)
+        self.invalidate(addr & ~1)
+        self.invalidate(addr | 1)
+
+    def invalidate(self, addr: int) -> None:
+        "drop every cached block covering addr"
+        starts = self.covering[addr]
+        if not starts:
+            return
+        for start in list(starts):
+            block = self.blocks[start]
+            self.blocks[start] = None
+            for covered in range(block.start, block.end):
+                self.covering[covered].discard(start)
+            self.stats.invalidations += 1
+        self.rewrites[addr] += 1
+        if self.rewrites[addr] >= VOLATILE_AFTER:
+            self.volatile[addr] = True
+
+    def scan(self, start: int) -> tuple[list[tuple[int, int, int, int]], bool]:
+        "find the extent of the block at start: its orders and whether it stores into itself"
+        orders = []
+        self_modifying = False
+        acc_zero = False
+        addr = start
+        while addr < MEMSIZE and len(orders) < MAX_BLOCK:
+            if self.volatile[addr] and orders:
+                break
+            op, n, long = decode_table[self.mem[addr]]
+            if op not in valid_ops:
+                break
+            orders.append((addr, op, n, long))
+            addr += 1
+            if op in (OP_T, OP_U, OP_I, OP_F):
+                targets = (n, n + 1) if long and op in (OP_T, OP_U) else (n,)
+                if any(start <= t < addr for t in targets):
+                    self_modifying = True
+                if any(addr <= t < start + MAX_BLOCK for t in targets):
+                    break
+            if op == OP_T:
+                acc_zero = True
+            elif op in (OP_A, OP_S, OP_V, OP_N, OP_C, OP_Y):
+                acc_zero = False
+            if op in (OP_Z, OP_O):
+                break
+            if op == OP_E and acc_zero:
+                break
+        return orders, self_modifying
+
+    def translate(self, start: int) -> Optional[Block]:
+        if self.volatile[start]:
+            return None
+        orders, self_modifying = self.scan(start)
+        if not orders:
+            return None
+        length = len(orders)
+        last_addr, last_op, last_n, _ = orders[-1]
+        loop = (
+            not self_modifying
+            and last_op == OP_E
+            and last_n == start
+            and self._ends_unconditional(orders)
+        )
+
+        body: list[str] = []
+        acc_zero = False
+        for index, (addr, op, n, long) in enumerate(orders):
+            done = index + 1
+            body.extend(self._emit(op, n, long))
+            if op in (OP_T, OP_U, OP_I, OP_F):
+                targets = (n, n + 1) if long and op in (OP_T, OP_U) else (n,)
+                for t in targets:
+                    body.append(f"if covering[{t}]: invalidate({t})")
+            if op == OP_E or op == OP_G:
+                unconditional = op == OP_E and acc_zero
+                never = op == OP_G and acc_zero
+                if never:
+                    pass
+                elif unconditional and loop and index == length - 1:
+                    body.append(f"k += {length}")
+                    body.append(f"if k + {length} > budget: return {start}, acc, mult, k")
+                    body.append("continue")
+                elif unconditional:
+                    body.append(f"return {n}, acc, mult, k + {done}")
+                else:
+                    body.append(_wrap)
+                    test = "acc >= 0" if op == OP_E else "acc < 0"
+                    body.append(f"if {test}: return {n}, acc, mult, k + {done}")
+            if op == OP_T:
+                acc_zero = True
+            elif op in (OP_A, OP_S, OP_V, OP_N, OP_C, OP_Y):
+                acc_zero = False
+        if not body or not body[-1].startswith(("return", "continue")):
+            body.append(_wrap)
+            body.append(f"return {last_addr + 1}, acc, mult, k + {length}")
+
+        lines = ["def block(acc, mult, budget):", "    k = 0"]
+        indent = "    "
+        if loop:
+            lines.append("    while True:")
+            indent = "        "
+        lines.extend(indent + line for line in body)
+        source = "\n".join(lines)
+
+        namespace = {
+            "mem": self.mem,
+            "sandwich": self.sandwich,
+            "covering": self.covering,
+            "invalidate": self.invalidate,
+            "m": self,
+        }
+        exec(compile(source, f"<edsac block {start}>", "exec"), namespace)
+        block = Block(start, last_addr + 1, length, namespace["block"], last_op == OP_O, loop, source, orders)
+        self.blocks[start] = block
+        for covered in range(block.start, block.end):
+            self.covering[covered].add(start)
+        self.stats.translations += 1
+        return block
+
+    @staticmethod
+    def _ends_unconditional(orders) -> bool:
+        "true when the final E follows a T with nothing changing acc in between"
+        for _, op, _, _ in reversed(orders[:-1]):
+            if op == OP_T:
+                return True
+            if op in (OP_A, OP_S, OP_V, OP_N, OP_C, OP_Y):
+                return False
+        return False
+
+    @staticmethod
+    def _emit(op: int, n: int, long: int) -> list[str]:
+        "python statements for one order; acc wraps lazily before it is tested or shifted right"
+        if long:
+            load = f"w = (mem[{n + 1}] << 18) | (sandwich[{n >> 1}] << 17) | mem[{n}]"
+            value = "(w - ((w & 0x400000000) << 1))"
+            place = _LONG_SHIFT
+        else:
+            load = f"w = mem[{n}]"
+            value = "(w - ((w & 0x10000) << 1))"
+            place = _SHORT_SHIFT
+        if op == OP_A:
+            return [load, f"acc += {value} << {place}"]
+        elif op == OP_S:
+            return [load, f"acc -= {value} << {place}"]
+        elif op == OP_T or op == OP_U:
+            if long:
+                store = [
+                    f"w = (acc >> {_LONG_SHIFT}) & {LONG_MASK}",
+                    f"mem[{n}] = w & {SHORT_MASK}",
+                    f"sandwich[{n >> 1}] = (w >> 17) & 1",
+                    f"mem[{n + 1}] = w >> 18",
+                ]
+            else:
+                store = [f"mem[{n}] = (acc >> {_SHORT_SHIFT}) & {SHORT_MASK}"]
+            return store + (["acc = 0"] if op == OP_T else [])
+        elif op == OP_H:
+            return [load, f"mult = {value}" if long else f"mult = {value} << 18"]
+        elif op == OP_V or op == OP_N:
+            sign = "+" if op == OP_V else "-"
+            factor = value if long else f"({value} << 18)"
+            return [load, f"acc {sign}= ({factor} * mult) << 2"]
+        elif op == OP_C:
+            if long:
+                return [load, f"w &= mult & {LONG_MASK}", f"acc += {value} << {place}"]
+            return [f"w = mem[{n}] & ((mult >> 18) & {SHORT_MASK})", f"acc += {value} << {place}"]
+        elif op == OP_L:
+            return [f"acc <<= {n}"]
+        elif op == OP_R:
+            return [_wrap, f"acc >>= {n}"]
+        elif op == OP_E or op == OP_G or op == OP_X:
+            return []
+        elif op == OP_O:
+            return [f"m.output(mem[{n}] >> 12)"]
+        elif op == OP_I:
+            return [f"mem[{n}] = next(m.tape, 0) & 0x1F"]
+        elif op == OP_F:
+            return [f"mem[{n}] = m.last_output << 12"]
+        elif op == OP_Y:
+            return [f"acc += {_ROUND_BIT}"]
+        elif op == OP_Z:
+            return ["m.halted = True"]
+        raise AssertionError(f"no translation for op {op}")
+
+    def run(self, max_orders: Optional[int] = None, stop_on_output: bool = False) -> int:
+        if self.halted:
+            return 0
+        blocks = self.blocks
+        stats = self.stats
+        limit = max_orders if max_orders is not None else _UNLIMITED
+        count = 0
+        block_count = 0
+        try:
+            while count < limit and not self.halted:
+                pc = self.pc
+                block = blocks[pc]
+                if block is None:
+                    block = self.translate(pc)
+                else:
+                    stats.hits += 1
+                if block is None or count + block.length > limit:
+                    # volatile, invalid or too close to the budget: interpret
+                    printed = self.characters_out
+                    executed = Machine.run(self, max_orders=1 if block is None else limit - count,
+                                           stop_on_output=stop_on_output)
+                    count += executed
+                    stats.interpreted += executed
+                    if executed == 0 or block is not None:
+                        break
+                    if stop_on_output and self.characters_out != printed:
+                        break
+                    continue
+                self.pc, self.acc, self.mult, executed = block.fn(self.acc, self.mult, limit - count)
+                count += executed
+                block_count += executed
+                if stop_on_output and block.output and executed == block.length:
+                    break
+        finally:
+            self.orders_executed += block_count
+            stats.block_orders += block_count
+        return count
@@ -1,27 +1,140 @@
+import codecs
 import sys
+import time
+from argparse import ArgumentParser
 
-# read all input, remove whitespace
-raw = sys.stdin.read().strip().lstrip("0").replace(" ", "").replace("\n", "")
-
-# split on decimal point to separate integer and fractional parts
-if "." in raw:
-    integer_part, fractional_part = raw.split(".", 1)
-    digits = fractional_part
-else:
-    # treat first digit as integer part if there's no decimal point
-    integer_part = raw[0] if raw else ""
-    digits = raw[1:] if len(raw) > 1 else ""
-
-# print integer part with decimal point
-print(f"{integer_part}.")
-
-# print in groups of 10, with 5 groups per line (50 digits per line)
-# add blank line every 1000 digits (every 20 lines)
-for line_num, line_start in enumerate(range(0, len(digits), 50)):
-    line_end = min(line_start + 50, len(digits))
-    groups = [digits[i:i+10] for i in range(line_start, line_end, 10)]
-    print(" ".join(groups))
-
-    # Add blank line after every 20 lines (1000 digits)
-    if (line_num + 1) % 20 == 0:
-        print()
\ No newline at end of file
+# format a stream of digits of pi as "3." then groups of 10, with 5 groups
+# per line (50 digits per line) and a blank line every 1000 digits.
+#
+# input is formatted as it arrives, holding back at most one partial line,
+# so a live emulator or spigot feed prints line by line in bounded memory.
+# whitespace is dropped and leading zeros skipped as before. the integer
+# part ends at the first "."; without one in the first HEAD_LOOKAHEAD
+# characters the first digit is taken as the integer part.
+
+CHUNK = 1 << 16
+HEAD_LOOKAHEAD = 64
+PROGRESS_INTERVAL_S = 0.5
+
+
+class DigitFormatter:
+
+    def __init__(self, out, progress = None):
+        self.out = out
+        self.progress = progress
+        self.digits = 0
+        self._state = "leading"
+        self._head = ""
+        self._pending = ""
+        self._partial = ""
+        self._lines = 0
+        self._started = time.perf_counter()
+        self._reported = self._started
+
+    def feed(self, text):
+        if self._state == "leading":
+            text = text.lstrip()
+            if not text:
+                return
+            self._state = "zeros"
+        if self._state == "zeros":
+            text = text.lstrip("0")
+            if not text:
+                return
+            self._state = "head"
+        text = text.replace(" ", "").replace("\n", "")
+        # whitespace that might end the input is held until something follows it
+        text = self._pending + text
+        body = text.rstrip()
+        self._pending = text[len(body):]
+        if not body:
+            return
+        if self._state == "head":
+            self._head += body
+            if "." in self._head:
+                integer_part, body = self._head.split(".", 1)
+            elif len(self._head) > HEAD_LOOKAHEAD:
+                integer_part, body = self._head[0], self._head[1:]
+            else:
+                return
+            self._start(integer_part)
+        self._body(body)
+
+    def close(self):
+        if self._state != "body":
+            head = self._head
+            if "." in head:
+                self._start(head.split(".", 1)[0])
+                self._body(head.split(".", 1)[1])
+            else:
+                self._start(head[:1])
+                self._body(head[1:])
+        if self._partial:
+            self._lines += 1
+            self.out.write(self._line(self._partial))
+            if self._lines % 20 == 0:
+                self.out.write("\n")
+        self.out.flush()
+        if self.progress is not None:
+            self._report(final=True)
+
+    def _start(self, integer_part):
+        self._state = "body"
+        self._head = ""
+        self.out.write(f"{integer_part}.\n")
+
+    def _body(self, text):
+        self.digits += len(text)
+        text = self._partial + text
+        full = len(text) - len(text) % 50
+        lines = []
+        for line_start in range(0, full, 50):
+            lines.append(self._line(text[line_start:line_start + 50]))
+            self._lines += 1
+            # Add blank line after every 20 lines (1000 digits)
+            if self._lines % 20 == 0:
+                lines.append("\n")
+        self._partial = text[full:]
+        if lines:
+            self.out.write("".join(lines))
+            self.out.flush()
+        if self.progress is not None:
+            self._report()
+
+    @staticmethod
+    def _line(digits):
+        return " ".join(digits[i:i + 10] for i in range(0, len(digits), 10)) + "\n"
+
+    def _report(self, final = False):
+        now = time.perf_counter()
+        if not final and now - self._reported < PROGRESS_INTERVAL_S:
+            return
+        self._reported = now
+        elapsed = now - self._started
+        rate = self.digits / elapsed if elapsed else 0.0
+        self.progress.write(f"\r{self.digits} digits, {rate:.0f} digits/s" + ("\n" if final else ""))
+        self.progress.flush()
+
+
+def format_stream(stream, out, progress = None):
+    "format a binary stream, reading whatever has arrived up to CHUNK bytes at a time"
+    formatter = DigitFormatter(out, progress)
+    decoder = codecs.getincrementaldecoder(sys.stdin.encoding or "utf-8")()
+    read = getattr(stream, "read1", stream.read)
+    while data := read(CHUNK):
+        formatter.feed(decoder.decode(data))
+    formatter.feed(decoder.decode(b"", final=True))
+    formatter.close()
+    return formatter.digits
+
+
+def main(commandline):
+    arg_parser = ArgumentParser(description="Format digits of pi from stdin in groups of 10, 50 to a line")
+    arg_parser.add_argument("--progress", help="Show digits formatted so far on stderr", action="store_true")
+    args = arg_parser.parse_args(commandline)
+
+    format_stream(sys.stdin.buffer, sys.stdout, sys.stderr if args.progress else None)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+run many spigot configurations at once as lanes of a numpy array
+
+one spigot run is a serial carry chain, but runs with different radixes,
+array lengths or initial values are independent. each configuration is a
+lane: a row of a 2-D int64 array holding its remainders a[0..array_len].
+every pass steps all live lanes through the i loop together, with one
+vectorised multiply and divmod per i; shorter lanes are padded with zeros,
+which pass a zero quotient through unchanged. the superdigits go through a
+carry detector per lane, exactly as compute_pi_digits, and a lane leaves
+the array once it has released its digits.
+
+the divmod is numpy's, so the lanes model divmodpy. numpy is optional for
+the rest of the project; install it with pip install numpy.
+
+usage:
+    python3 spigot_batch.py --digits 100 252 --radix 10 100 1000 --array_len 0 842
+"""
+import itertools
+import math
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import *
+
+import spigot_edsac
+from spigot_reference import DEFAULT_CACHE, ReferenceCache, cache_reader, check_chunks
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+INT64_MAX = (1 << 63) - 1
+
+
+@dataclass
+class Lane:
+    "one spigot configuration; array_len and init default as in compute_pi_digits"
+    n: int
+    radix: int = 10
+    array_len: int = 0
+    init: int = 0
+
+    def __post_init__(self):
+        self.log_radix = int(math.log10(self.radix))
+        self.digits_remaining = self.log_radix + self.n + 3 # bits stuck in carry detection buffer
+        self.array_len = self.array_len or int(((self.digits_remaining // self.log_radix) + 1) * 14)
+        self.init = self.init or self.radix // 5
+
+    def fits_int64(self):
+        "whether every radix * a[i] + q * i of the run stays below 2**63"
+        # a[i] < 2i - 1 after the first pass, and q stays under about twice radix * a[i]
+        bound = max(2 * self.array_len, self.init, self.radix)
+        return 3 * self.radix * bound * self.array_len <= INT64_MAX
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError("spigot_batch needs numpy: pip install numpy")
+
+
+def compute_pi_digits_batch(lanes):
+    "the digits of compute_pi_digits for every lane, as lists of digit values"
+    require_numpy()
+    for lane in lanes:
+        if not lane.fits_int64():
+            raise ValueError(f"n={lane.n} radix={lane.radix} array_len={lane.array_len} overflows int64")
+
+    stages = [spigot_edsac.DigitStage(lane.radix, spigot_edsac.carry_detector, lane.digits_remaining) for lane in lanes]
+    digits_remaining = [lane.digits_remaining for lane in lanes]
+
+    # one row per lane, stored by column so each a[i] across the lanes is contiguous
+    live = list(range(len(lanes)))
+    a = np.zeros((len(lanes), max(lane.array_len for lane in lanes) + 1), dtype=np.int64, order="F")
+    for row, lane in enumerate(lanes):
+        a[row, 1:lane.array_len + 1] = lane.init
+    radix = np.array([lane.radix for lane in lanes], dtype=np.int64)
+    lengths = [lane.array_len for lane in lanes]
+
+    # main loop
+    while live:
+        quotient = np.zeros(len(live), dtype=np.int64)
+        carried = np.empty_like(quotient)
+
+        # inner i-loop, every live lane at once, from the longest live array down to i=1
+        # working in place, as the loop is a few ufunc calls on short rows
+        for i in range(max(lengths), 0, -1):
+            column = a[:, i]
+            np.multiply(column, radix, out=column)
+            np.multiply(quotient, i, out=carried)
+            np.add(column, carried, out=carried)
+            np.divmod(carried, 2 * i - 1, out=(quotient, column))
+
+        # divide by radix to extract digits
+        new_quotient, a[:, 1] = np.divmod(quotient, radix)
+
+        # output processing for quotient, lane by lane
+        finished = []
+        for row, lane_index in enumerate(live):
+            digits_remaining[lane_index] -= stages[lane_index].release(int(new_quotient[row]))
+            if digits_remaining[lane_index] < 0:
+                finished.append(row)
+
+        # drop finished lanes from the array
+        if finished:
+            keep = [row for row in range(len(live)) if row not in finished]
+            live = [live[row] for row in keep]
+            lengths = [lengths[row] for row in keep]
+            if live:
+                a = np.asfortranarray(a[keep, :max(lengths) + 1])
+                radix = radix[keep]
+
+    return [list(stage.view()) for stage in stages]
+
+
+def check_lanes(lanes, outputs, cache_path = DEFAULT_CACHE):
+    "a CheckResult per lane for the first n digits of its output against the reference"
+    cache = ReferenceCache(cache_path)
+    cache.ensure(max(lane.n for lane in lanes))
+    results = []
+    for lane, digits in zip(lanes, outputs):
+        checked = bytes(48 + digit for digit in digits[:lane.n])
+        results.append(check_chunks([checked], cache_reader(cache)))
+    cache.close()
+    return results
+
+
+def main(commandline):
+    arg_parser = ArgumentParser(description="Run every combination of spigot parameters as lanes of one numpy array and check their digits")
+    arg_parser.add_argument("--digits", help="Digits to compute", type=int, nargs="+", default=[100, 252])
+    arg_parser.add_argument("--radix", help="Radixes, powers of 10", type=int, nargs="+", default=[10, 100, 1000])
+    arg_parser.add_argument("--array_len", help="Array lengths, 0 to derive from the digits", type=int, nargs="+", default=[0])
+    arg_parser.add_argument("--init", help="Initial values of a[i], 0 for radix // 5", type=int, nargs="+", default=[0])
+    arg_parser.add_argument("--cache", help="Reference digit cache file", default=DEFAULT_CACHE)
+    args = arg_parser.parse_args(commandline)
+
+    if np is None:
+        arg_parser.error("numpy is needed: pip install numpy")
+
+    lanes = [Lane(*config) for config in itertools.product(args.digits, args.radix, args.array_len, args.init)]
+    outputs = compute_pi_digits_batch(lanes)
+    results = check_lanes(lanes, outputs, args.cache)
+
+    print(f"{'digits':>7} {'radix':>6} {'array':>7} {'init':>6}  check")
+    for lane, result in zip(lanes, results):
+        check = "ok" if result.ok else f"digit {result.first_mismatch}, {result.mismatches} wrong"
+        print(f"{lane.n:>7} {lane.radix:>6} {lane.array_len:>7} {lane.init:>6}  {check}")
+    print(f"{sum(result.ok for result in results)} of {len(lanes)} lanes match the reference")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
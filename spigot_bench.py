@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+time the spigot, the reference generators and the assembler parser
+
+each benchmark is run --repeat times and its median time kept. results are
+written as JSON and compared with a baseline, normally the committed
+bench_baseline.json; a benchmark slower than the baseline by more than
+--threshold times is a regression and the exit status is 1.
+
+times are compared relative to a calibration loop run alongside them, so a
+baseline taken on one machine still means something on another.
+
+usage:
+    python3 spigot_bench.py
+    python3 spigot_bench.py --only spigot --threshold 1.5
+    python3 spigot_bench.py --write_baseline
+"""
+import glob
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import *
+
+import spigot_edsac
+import spigot_reference
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "asm"))
+import asm
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "bench_baseline.json")
+ASM_SOURCES = os.path.join(HERE, "src", "*.asm")
+
+DETECTORS = {
+    "none": spigot_edsac.carry_detector0,
+    "minimal": spigot_edsac.carry_detector1,
+    "general": spigot_edsac.carry_detector_general,
+}
+# (divmod, digits, radixes); repeated subtraction takes radix steps per digit, so it runs small
+SPIGOT_GRID = [
+    (spigot_edsac.divmodpy, (100, 250), (10, 100, 10000)),
+    (spigot_edsac.divmod_slow, (100,), (10, 100)),
+]
+REFERENCE_DIGITS = 20000
+GIBBONS_DIGITS = 2000
+CALIBRATION_LOOPS = 1_000_000
+# quick benchmarks are called repeatedly until a timing takes this long;
+# shorter timings are swamped by scheduling noise on shared machines
+MIN_TIMING_S = 0.3
+# slowdown over the baseline, after calibration, counted as a regression
+DEFAULT_THRESHOLD = 1.75
+
+
+@dataclass
+class Benchmark:
+    name: str
+    group: str
+    run: Callable[[], object]
+
+
+def spigot_run(detector, divide, digits, radix):
+    def run():
+        spigot_edsac.carry_detector = detector
+        spigot_edsac.divmod_local = divide
+        spigot_edsac.compute_pi_digits(digits, radix)
+    return run
+
+
+def asm_parse_run(paths):
+    parser = asm.edsac_grammar()
+    sources = []
+    for path in paths:
+        with open(path, "r") as source_file:
+            sources.append(source_file.read())
+
+    def run():
+        for source_txt in sources:
+            parser.parse(source_txt)
+    return run
+
+
+def benchmarks():
+    "every benchmark in the suite, in the order they run"
+    suite = []
+    for divide, digit_counts, radixes in SPIGOT_GRID:
+        for digits, radix, (detector_name, detector) in itertools.product(digit_counts, radixes, DETECTORS.items()):
+            name = f"spigot/{divide.__name__}/{detector_name}/radix{radix}/{digits}"
+            suite.append(Benchmark(name, "spigot", spigot_run(detector, divide, digits, radix)))
+    suite.append(Benchmark(f"reference/chudnovsky/{REFERENCE_DIGITS}", "reference",
+                           lambda: spigot_reference.chudnovsky_digits(REFERENCE_DIGITS)))
+    suite.append(Benchmark(f"reference/gibbons/{GIBBONS_DIGITS}", "reference",
+                           lambda: list(itertools.islice(spigot_reference.pi_digits(), GIBBONS_DIGITS))))
+    paths = sorted(glob.glob(ASM_SOURCES))
+    for path in paths:
+        suite.append(Benchmark(f"asm/parse/{os.path.basename(path)}", "asm", asm_parse_run([path])))
+    return suite
+
+
+def calibration():
+    "a fixed loop of plain python, timing the interpreter rather than this code"
+    total = 0
+    for i in range(CALIBRATION_LOOPS):
+        total += i * i
+    return total
+
+
+def median_time(run, repeat):
+    "median seconds per call over repeat timings, each of enough calls to take MIN_TIMING_S"
+    calls = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(calls):
+            run()
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_TIMING_S:
+            break
+        calls *= 2
+    timings = [elapsed / calls]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(calls):
+            run()
+        timings.append((time.perf_counter() - started) / calls)
+    return statistics.median(timings)
+
+
+def run_suite(suite, repeat, progress = None):
+    "the results document: calibration time and the median time of each benchmark"
+    detector, divide = spigot_edsac.carry_detector, spigot_edsac.divmod_local
+    results = {}
+    try:
+        calibration_s = median_time(calibration, repeat)
+        for benchmark in suite:
+            results[benchmark.name] = median_time(benchmark.run, repeat)
+            if progress is not None:
+                progress.write(f"{benchmark.name:<48} {1000 * results[benchmark.name]:10.1f} ms\n")
+                progress.flush()
+    finally:
+        spigot_edsac.carry_detector, spigot_edsac.divmod_local = detector, divide
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "calibration_s": calibration_s,
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    "(name, calibrated slowdown) for every benchmark in both, and the names of the regressions"
+    scale = baseline["calibration_s"] / current["calibration_s"]
+    ratios = []
+    for name, seconds in current["results"].items():
+        if name in baseline["results"]:
+            ratios.append((name, seconds * scale / baseline["results"][name]))
+    regressions = [name for name, ratio in ratios if ratio > threshold]
+    return ratios, regressions
+
+
+def main(commandline):
+    arg_parser = ArgumentParser(description="Time the spigot, reference generators and assembler, and compare with a baseline")
+    arg_parser.add_argument("--only", help="Run only these groups", nargs="+", choices=["spigot", "reference", "asm"], required=False)
+    arg_parser.add_argument("--repeat", help="Runs of each benchmark, the median is kept", type=int, default=7)
+    arg_parser.add_argument("--baseline", help="Baseline results to compare with", default=DEFAULT_BASELINE)
+    arg_parser.add_argument("--threshold", help="Calibrated slowdown over the baseline counted as a regression", type=float, default=DEFAULT_THRESHOLD)
+    arg_parser.add_argument("--json", help="Also write the results to this file", required=False)
+    arg_parser.add_argument("--write_baseline", help="Write the results to --baseline instead of comparing", action="store_true", default=False)
+    args = arg_parser.parse_args(commandline)
+
+    suite = [benchmark for benchmark in benchmarks() if args.only is None or benchmark.group in args.only]
+    current = run_suite(suite, args.repeat, sys.stderr)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(current, json_file, indent=2)
+    if args.write_baseline:
+        if args.only and os.path.exists(args.baseline):
+            # keep the groups that were not run
+            with open(args.baseline, "r") as baseline_file:
+                previous = json.load(baseline_file)
+            scale = current["calibration_s"] / previous["calibration_s"]
+            current["results"] = {name: seconds * scale for name, seconds in previous["results"].items()} | current["results"]
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(current, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print(f"{args.baseline}: {len(current['results'])} benchmarks")
+        return
+
+    if not os.path.exists(args.baseline):
+        arg_parser.error(f"no baseline at {args.baseline}, make one with --write_baseline")
+    with open(args.baseline, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+    ratios, regressions = compare(current, baseline, args.threshold)
+    for name, ratio in ratios:
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<48} {ratio:6.2f}x{flag}")
+    missing = [name for name in current["results"] if name not in baseline["results"]]
+    for name in missing:
+        print(f"{name:<48}   new, not in the baseline")
+    if regressions:
+        print(f"{len(regressions)} of {len(ratios)} benchmarks over {args.threshold:.2f}x the baseline")
+        sys.exit(1)
+    print(f"{len(ratios)} benchmarks within {args.threshold:.2f}x the baseline")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -5,9 +5,28 @@ and was used to validate correctness
 
 usage:
     python3 spigot_edsac.py
+    python3 spigot_edsac.py 1000 100 --shrink
+    python3 spigot_edsac.py 2037 100 --checkpoint pi.ckpt --checkpoint_every 50
+    python3 spigot_edsac.py --resume pi.ckpt
+    python3 spigot_edsac.py 1000 100 --tape --segment_len 512
+    python3 spigot_edsac.py 250 100 --divmod shift
+    python3 spigot_edsac.py 2037 100 --cost --cost_csv cost.csv
+    python3 spigot_edsac.py 250 1000 --fixed_width
 """
+import csv
+import os
 import sys
 import math
+import struct
+import tempfile
+from argparse import ArgumentParser
+from array import array
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Optional
+
+from edsac import TimingModel
 
 # complete carry handling
 def carry_detector_general(radix):
@@ -59,6 +78,16 @@ def carry_detector1(radix):
     return detector
 
 
+@dataclass
+class DivmodCount:
+    "calls to the counting divmods and the orders their EDSAC routines execute, return included"
+    calls: int = 0
+    orders: int = 0
+
+
+divmod_count = DivmodCount()
+
+
 def divmod_slow(numerator, denominator):
     quotient = 0
     remainder = numerator
@@ -72,9 +101,62 @@ def divmod_slow(numerator, denominator):
         remainder = test
         quotient = quotient + 1
 
+    divmod_count.calls += 1
+    divmod_count.orders += divmod_slow_orders(quotient)
     return quotient, remainder
 
 
+def divmod_slow_orders(quotient):
+    "orders .divmod in pi_mem.asm executes for a quotient, return included"
+    return 10 + 8 * quotient
+
+
+def divmod_slow_steps(quotient):
+    "trips round .divmod's subtraction loop, the last one failing"
+    return quotient + 1
+
+
+# restoring division as .divmod_shift in src/lib/divmod_shift.asm: the
+# denominator is lined up bits places above the numerator, and each step
+# doubles the numerator and subtracts the denominator if it can. the
+# routine has 14 steps; bits models it with that many instead
+DIVMOD_SHIFT_BITS = 14
+
+
+def divmod_shift(numerator, denominator, bits = DIVMOD_SHIFT_BITS):
+    denominator = denominator << bits
+    if numerator >= denominator:
+        raise ValueError(f"quotient of {numerator} and {denominator >> bits} does not fit in {bits} bits")
+    for _ in range(bits):
+        numerator = 2 * numerator
+        if numerator >= denominator:
+            numerator = numerator - denominator + 1
+    quotient = numerator & ((1 << bits) - 1)
+
+    divmod_count.calls += 1
+    divmod_count.orders += divmod_shift_orders(quotient, bits)
+    return quotient, numerator >> bits
+
+
+def divmod_shift_fits(radix, bits = DIVMOD_SHIFT_BITS):
+    "whether every quotient for this radix fits; they stay below radix * (radix + 12), the largest at i = 1"
+    return (radix * (radix + 12) - 1).bit_length() <= bits
+
+
+def divmod_shift_orders(quotient, bits = DIVMOD_SHIFT_BITS):
+    "orders .divmod_shift executes for a quotient, return included"
+    # an order shifts at most 13 places, L 0 F; the routine's 14 take two
+    shift_orders = -(-bits // 13)
+    # prologue and set up, 11 per step and 1 more per quotient bit, a
+    # shorter last count, splitting into quotient and remainder, return
+    return 6 + shift_orders + 11 * bits + quotient.bit_count() + 5 + 2 * shift_orders
+
+
+def divmod_shift_steps(quotient, bits = DIVMOD_SHIFT_BITS):
+    "steps .divmod_shift takes, one per quotient bit whatever the quotient"
+    return bits
+
+
 def divmodpy(numerator, denominator):
     return divmod(numerator, denominator)
 
@@ -87,22 +169,183 @@ def main_inner(radix, remainder, quotient, i):
 
 
 divmod_local = divmodpy
+divmod_choices = {"py": divmodpy, "slow": divmod_slow, "shift": divmod_shift}
 carry_detector = carry_detector1
 
-def compute_pi_digits(n, radix = 10):
+
+@dataclass
+class SpigotStats:
+    passes: int = 0
+    inner_steps: int = 0
+    array_len: int = 0
+
+    @property
+    def full_steps(self):
+        "inner steps a full-length sweep on every pass would take"
+        return self.passes * self.array_len
+
+
+def shrunk_array_len(digits_remaining, const_log_radix, const_array_len):
+    # each term scales the tail by i / (2i + 1) < 1/2, so about log2(10) terms
+    # per digit still to come are enough; the rest can no longer reach them.
+    # two superdigits and one superdigit's worth of terms are kept as guard
+    guard_digits = 2 * const_log_radix
+    terms = math.ceil((digits_remaining + guard_digits) * math.log2(10)) + 14
+    return min(const_array_len, terms)
+
+
+def remainder_array(const_array_len, const_init, radix):
+    "a[0..const_array_len] as a typed array when every remainder fits a machine word, else a list"
+    # a[i] < 2i - 1 after the first pass, a[1] < radix
+    bound = max(2 * const_array_len, radix, const_init)
+    for typecode in ("I", "Q"):
+        if bound < 1 << (8 * array(typecode).itemsize):
+            return array(typecode, [0]) + array(typecode, [const_init]) * const_array_len
+    return [0] + [const_init] * const_array_len
+
+
+# digit release
+#
+# DigitStage writes released superdigits straight into a bytearray of digit
+# values, copying each from a table of every superdigit's digits, where the
+# carry detectors return a new list each time. for the detectors above it
+# does their carry detection itself, keeping pending carries as a count;
+# any other detector, such as the cost model's hooks, has its lists written
+# out the same way.
+
+_ascii_digits = bytes.maketrans(b"0123456789", bytes(range(10)))
+
+
+class DigitStage:
+    "digit values released by carry detection, in a buffer grown as needed"
+
+    def __init__(self, radix, detector_factory, capacity = 0):
+        self.radix = radix
+        self.log_radix = int(math.log10(radix))
+        self.mode = _stage_modes.get(detector_factory)
+        self._detector = detector_factory(radix)
+        table = "".join(f"{d:0{self.log_radix}}" for d in range(radix)).encode()
+        self._table = memoryview(table.translate(_ascii_digits))
+        self.buffer = bytearray(capacity)
+        self.length = 0
+        self.predigit = None
+        self.carries = 0
+
+    def release(self, d):
+        "take the next superdigit, returning how many digits it released"
+        start = self.length
+        if self.mode is None:
+            released = self._detector(d)
+            if released is not None:
+                for superdigit in released:
+                    self._write(superdigit)
+        elif self.mode == "none":
+            self._write(d)
+        elif self.predigit is None:
+            self.predigit = d
+        elif self.mode == "minimal":
+            if d == self.radix:
+                self._write(self.predigit + 1)
+                self.predigit = 0
+            else:
+                self._write(self.predigit)
+                self.predigit = d
+        elif d < self.radix - 1:
+            self._write(self.predigit)
+            for _ in range(self.carries):
+                self._write(self.radix - 1)
+            self.predigit = d
+            self.carries = 0
+        elif d == self.radix - 1:
+            self.carries += 1
+        elif d == self.radix:
+            self._write(self.predigit + 1)
+            for _ in range(self.carries):
+                self._write(0)
+            self.carries = 0
+            self.predigit = 0
+        else:
+            assert False
+        return self.length - start
+
+    def _write(self, superdigit):
+        width = self.log_radix
+        if not 0 <= superdigit < self.radix:
+            # a carry out of the top superdigit, formatted as it comes
+            self.extend(bytes(int(c) for c in f"{superdigit:0{width}}"))
+            return
+        if self.length + width > len(self.buffer):
+            self._grow(width)
+        start = superdigit * width
+        self.buffer[self.length:self.length + width] = self._table[start:start + width]
+        self.length += width
+
+    def extend(self, digits):
+        "append digit values as they are, e.g. those released before a checkpoint"
+        if self.length + len(digits) > len(self.buffer):
+            self._grow(len(digits))
+        self.buffer[self.length:self.length + len(digits)] = digits
+        self.length += len(digits)
+
+    def _grow(self, needed):
+        self.buffer.extend(bytes(max(needed, len(self.buffer), 64)))
+
+    def view(self):
+        "the digits released so far without copying; release it before the stage grows again"
+        return memoryview(self.buffer)[:self.length]
+
+    def detector_state(self):
+        "closure variables the detector would have, as detector_state gives them"
+        if self.mode is None:
+            return detector_state(self._detector)
+        values = {"predigit": self.predigit, "carries": self.carries, "carry_limit": self.radix - 1, "radix": self.radix}
+        return {name: values[name] for name in self._detector.__code__.co_freevars}
+
+    def restore_detector_state(self, state):
+        if self.mode is None:
+            restore_detector_state(self._detector, state)
+            return
+        self.predigit = state.get("predigit", self.predigit)
+        self.carries = state.get("carries", self.carries)
+
+
+_stage_modes = {carry_detector_general: "general", carry_detector1: "minimal", carry_detector0: "none"}
+
+
+def iter_pi_chunks(radix, n, shrink = False, stats = None, resume = None, checkpoint = None, checkpoint_every = 100, array_len = None, stage = None):
+    """
+    the digits of iter_pi_digits as bytes of digit values, one chunk per pass that released any
+    stage, when given, receives every digit released, so stage.view() has them all at the end
+    """
 
     const_log_radix = int(math.log10(radix))
     const_init = radix // 5
     digits_remaining = const_log_radix + n + 3 # bits stuck in carry detection buffer
-    const_array_len = int(((digits_remaining // const_log_radix) + 1) * 14)
-    released_digits = carry_detector(radix)
+    const_array_len = array_len or int(((digits_remaining // const_log_radix) + 1) * 14)
+    if stage is None:
+        stage = DigitStage(radix, carry_detector, digits_remaining + 2 * const_log_radix)
+    if stats is not None:
+        stats.array_len = const_array_len
 
     # initialise array
     # a[0] is unused, but included for clarity
-    a = [0] + [const_init] * const_array_len
+    a = remainder_array(const_array_len, const_init, radix)
 
-    output = []
     iteration = 0
+    active_len = const_array_len
+
+    if resume is not None:
+        if (resume.radix, resume.n) != (radix, n):
+            raise ValueError(f"checkpoint is for n={resume.n} radix={resume.radix}")
+        # copy the array so one state can seed many runs
+        a[:] = type(a)(a.typecode, resume.a) if isinstance(a, array) else list(resume.a)
+        iteration = resume.iteration
+        digits_remaining = resume.digits_remaining
+        active_len = resume.active_len
+        stage.restore_detector_state(resume.detector)
+        stage.extend(resume.output)
+        if resume.output:
+            yield bytes(resume.output)
 
     # main loop
     while digits_remaining >= 0:
@@ -112,8 +355,13 @@ def compute_pi_digits(n, radix = 10):
         # initialise quotient to 0
         quotient = 0
 
-        # initialise i to array_len
-        i = const_array_len
+        # initialise i to array_len, or to the terms still needed when shrinking
+        if shrink:
+            active_len = shrunk_array_len(digits_remaining, const_log_radix, active_len)
+        i = active_len
+        if stats is not None:
+            stats.passes += 1
+            stats.inner_steps += active_len
 
         # inner i-loop
         # loop from arraylen down to i=1 (NOT including i=0)
@@ -141,33 +389,515 @@ def compute_pi_digits(n, radix = 10):
         a[1] = remainder
 
         # output processing for quotient
-        output_digits = released_digits(new_quotient)
-        if output_digits is not None:
-            for output_digit in output_digits:
-                for c in f"{output_digit:0{const_log_radix}}":
-                    output.append(int(c))
-                    digits_remaining -= 1
-
-    return output
-
-
-if __name__ == "__main__":
+        released = stage.release(new_quotient)
+        if released:
+            digits_remaining -= released
+            yield stage.buffer[stage.length - released:stage.length]
+
+        if checkpoint is not None and iteration % checkpoint_every == 0:
+            state = SpigotState(radix, n, iteration, digits_remaining, active_len, a,
+                                stage.detector_state(), bytes(stage.view()))
+            save_spigot_state(state, checkpoint)
+
+
+def iter_pi_digits(radix, n, shrink = False, stats = None, resume = None, checkpoint = None, checkpoint_every = 100, array_len = None):
+    """
+    yield the digits of compute_pi_digits(n, radix) as the carry detector releases them
+    resume continues from a SpigotState, yielding the digits released before it first;
+    checkpoint names a file to save the state to every checkpoint_every passes;
+    array_len replaces the derived array length, as pi_mem.asm does with $array_len
+    """
+    for chunk in iter_pi_chunks(radix, n, shrink, stats, resume, checkpoint, checkpoint_every, array_len):
+        yield from chunk
+
+
+def pi_digit_view(n, radix = 10, shrink = False, stats = None, array_len = None):
+    "the digits of compute_pi_digits as a memoryview of digit values, with no list or per-digit objects"
+    const_log_radix = int(math.log10(radix))
+    stage = DigitStage(radix, carry_detector, const_log_radix * 2 + n + 3)
+    for _ in iter_pi_chunks(radix, n, shrink, stats, array_len=array_len, stage=stage):
+        pass
+    return stage.view()
+
+
+def compute_pi_digits(n, radix = 10, shrink = False, stats = None):
+    return list(pi_digit_view(n, radix, shrink, stats))
+
+
+# analytic cost of pi_mem.asm on EDSAC
+#
+# instrument() swaps main_inner, divmod_local and carry_detector for hooks
+# that count what the model does, and each count is charged the orders
+# pi_mem.asm spends on it, calls and returns included. divmod is charged
+# as .divmod, or as .divmod_shift when that is the divmod_local in use.
+# superdigits are printed as two characters, as pi_mem.asm does for radix 100
+
+START_ORDERS = 6            # three format characters, array length, the halt at the end
+ARRAY_INIT_ORDERS = 9       # per element, a[0] included
+INNER_STEP_ORDERS = 42      # i-loop body and .main_inner, less its divmod
+INNER_STEP_MULTIPLIES = 2   # radix * a[i] and q * i
+PASS_ORDERS = 24            # pass set up, divmod by radix, a[1], digits remaining
+DETECTOR_INIT_ORDERS = 12   # first pass, predigit only
+DETECTOR_ORDERS = 18        # release the predigit
+DETECTOR_CARRY_ORDERS = 17  # release predigit + 1
+SUPERDIGIT_ORDERS = 17      # .output_superdigit less its divmod by 10
+SUPERDIGIT_CHARACTERS = 2
+START_CHARACTERS = 3
+
+
+@dataclass
+class SpigotCost:
+    "what pi_mem.asm would do for a run of the model, and how long EDSAC would take"
+    timing: TimingModel = field(default_factory=TimingModel)
+    passes: int = 0
+    inner_steps: int = 0
+    divmod_calls: int = 0
+    divmod_steps: int = 0
+    multiplies: int = 0
+    characters: int = 0
+    orders: int = 0
+    # totals at the end of each pass
+    curve: list = field(default_factory=list)
+
+    def machine_ms(self, orders = None, multiplies = None, characters = None):
+        "EDSAC time for the totals so far, or for the counts given"
+        orders = self.orders if orders is None else orders
+        multiplies = self.multiplies if multiplies is None else multiplies
+        characters = self.characters if characters is None else characters
+        return (
+            (orders - multiplies - characters) * self.timing.ordinary_ms
+            + multiplies * self.timing.multiply_ms
+            + characters * self.timing.output_ms
+        )
+
+    def end_pass(self):
+        self.passes += 1
+        self.curve.append((self.passes, self.inner_steps, self.divmod_calls, self.divmod_steps,
+                           self.multiplies, self.characters, self.orders))
+
+    def write_csv(self, path):
+        "one row per pass: its own counts and EDSAC time, and the time so far"
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["pass", "inner_steps", "divmod_calls", "divmod_steps", "multiplies",
+                             "characters", "orders", "machine_s", "total_machine_s"])
+            previous = (0,) * 7
+            for totals in self.curve:
+                counts = [total - last for total, last in zip(totals[1:], previous[1:])]
+                pass_ms = self.machine_ms(counts[5], counts[3], counts[4])
+                writer.writerow([totals[0], *counts, f"{pass_ms / 1000:.3f}",
+                                 f"{self.machine_ms(totals[6], totals[4], totals[5]) / 1000:.3f}"])
+                previous = totals
+
+    def __str__(self):
+        hours = self.machine_ms() / 3_600_000
+        return (
+            f"{self.passes} passes, {self.inner_steps} inner steps, {self.divmod_steps} divmod steps "
+            f"over {self.divmod_calls} calls, {self.multiplies} multiplies, {self.characters} characters: "
+            f"{self.orders} orders, {hours:.2f} hours on EDSAC"
+        )
+
+
+@contextmanager
+def instrument(cost):
+    "count into cost what pi_mem.asm would do while the model runs"
+    global main_inner, divmod_local, carry_detector
+    saved = main_inner, divmod_local, carry_detector
+    inner, divide, detector_factory = saved
+    if divide is divmod_shift:
+        routine_orders, routine_steps = divmod_shift_orders, divmod_shift_steps
+    else:
+        routine_orders, routine_steps = divmod_slow_orders, divmod_slow_steps
+
+    def charge_divmod(quotient):
+        cost.divmod_calls += 1
+        cost.divmod_steps += routine_steps(quotient)
+        cost.orders += routine_orders(quotient)
+
+    def counted_main_inner(radix, remainder, quotient, i):
+        if not cost.inner_steps:
+            # the array is set up once, over its full length
+            cost.orders += START_ORDERS + ARRAY_INIT_ORDERS * (i + 1)
+            cost.characters += START_CHARACTERS
+        cost.inner_steps += 1
+        cost.multiplies += INNER_STEP_MULTIPLIES
+        cost.orders += INNER_STEP_ORDERS
+        return inner(radix, remainder, quotient, i)
+
+    def counted_divmod(numerator, denominator):
+        quotient, remainder = divide(numerator, denominator)
+        charge_divmod(quotient)
+        return quotient, remainder
+
+    def counted_carry_detector(radix):
+        detector = detector_factory(radix)
+
+        def counted(d):
+            released = detector(d)
+            if released is None:
+                cost.orders += PASS_ORDERS + DETECTOR_INIT_ORDERS
+            else:
+                cost.orders += PASS_ORDERS + (DETECTOR_CARRY_ORDERS if d == radix else DETECTOR_ORDERS)
+                for superdigit in released:
+                    cost.orders += SUPERDIGIT_ORDERS
+                    cost.characters += SUPERDIGIT_CHARACTERS
+                    charge_divmod(superdigit // 10)
+            cost.end_pass()
+            return released
+
+        return counted
+
+    main_inner, divmod_local, carry_detector = counted_main_inner, counted_divmod, counted_carry_detector
+    try:
+        yield cost
+    finally:
+        main_inner, divmod_local, carry_detector = saved
+
+
+# pi_mem.asm word widths
+#
+# fixed_width() runs the model with the words pi_mem.asm keeps its values
+# in: products and numerators are 35 bit long words, the array and the
+# quotient of a pass, read back with short loads, are 17 bit short words.
+# values wrap around as two's complement, the array holds 17 bit patterns,
+# and a negative numerator divides as .divmod does, to a quotient of 0.
+
+LONG_BITS = 35
+SHORT_BITS = 17
+
+
+def wrap(value, bits):
+    "value as a two's complement word of this many bits"
+    sign = 1 << (bits - 1)
+    return ((value + sign) & ((sign << 1) - 1)) - sign
+
+
+@dataclass
+class WordWidths:
+    "largest values seen per quantity, and where the first one did not fit its word"
+    iteration: int = 1
+    overflows: int = 0
+    # (iteration, i, quantity, value); i is 0 for the division by radix
+    first_overflow: Optional[tuple] = None
+    # quantity -> (largest value, word bits)
+    peaks: dict = field(default_factory=dict)
+
+    def fit(self, quantity, value, bits, i):
+        "value as stored in a word of this many bits, recording it"
+        peak, _ = self.peaks.get(quantity, (0, bits))
+        if value > peak:
+            self.peaks[quantity] = (value, bits)
+        stored = wrap(value, bits)
+        if stored != value:
+            self.overflows += 1
+            if self.first_overflow is None:
+                self.first_overflow = (self.iteration, i, quantity, value)
+        return stored
+
+    def __str__(self):
+        if self.first_overflow is None:
+            lines = ["no overflow"]
+        else:
+            iteration, i, quantity, value = self.first_overflow
+            lines = [f"{self.overflows} overflows, first at iteration {iteration} i {i}: {quantity} = {value}"]
+        for quantity, (peak, bits) in self.peaks.items():
+            lines.append(f"  {quantity:<14} peak {peak:>14}, {bits - 1 - peak.bit_length():>3} bits headroom in {bits}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def fixed_width(widths):
+    "run the model in pi_mem.asm's word widths, recording peaks and overflows in widths"
+    global main_inner, divmod_local, carry_detector
+    saved = main_inner, divmod_local, carry_detector
+    _, divide, detector_factory = saved
+    short_mask = (1 << SHORT_BITS) - 1
+
+    def fixed_divide(numerator, denominator):
+        # .divmod exits at once when the numerator is negative
+        if numerator < 0:
+            return 0, numerator
+        return divide(numerator, denominator)
+
+    def fixed_main_inner(radix, remainder, quotient, i):
+        remainder = wrap(remainder, SHORT_BITS)
+        product = widths.fit("radix * a[i]", radix * remainder, LONG_BITS, i)
+        carried = widths.fit("q * i", quotient * i, LONG_BITS, i)
+        x = widths.fit("numerator", product + carried, LONG_BITS, i)
+        new_quotient, new_remainder = fixed_divide(x, 2 * i - 1)
+        return new_quotient, widths.fit("a[i]", new_remainder, SHORT_BITS, i) & short_mask
+
+    def fixed_pass_divmod(numerator, denominator):
+        quotient, remainder = fixed_divide(widths.fit("pass quotient", numerator, SHORT_BITS, 0), denominator)
+        return quotient, remainder & short_mask
+
+    def counted_carry_detector(radix):
+        detector = detector_factory(radix)
+
+        def counted(d):
+            released = detector(d)
+            widths.iteration += 1
+            return released
+
+        return counted
+
+    main_inner, divmod_local, carry_detector = fixed_main_inner, fixed_pass_divmod, counted_carry_detector
+    try:
+        yield widths
+    finally:
+        main_inner, divmod_local, carry_detector = saved
+
+
+# checkpoints of the python model
+#
+#   header    magic, version, radix, n, iteration, digits_remaining, active_len
+#   detector  closure variables of the carry detector: name, then None or an int
+#   array     typecode and length of a, then its raw bytes
+#   output    digits released so far, one byte each
+
+@dataclass
+class SpigotState:
+    radix: int
+    n: int
+    iteration: int
+    digits_remaining: int
+    active_len: int
+    a: object
+    detector: dict
+    output: bytes
+
+
+_state_magic = b"LOPI"
+_state_version = 1
+_state_header = struct.Struct("<4sHQQQqQ")
+_state_var = struct.Struct("<B?q")
+_state_length = struct.Struct("<Q")
+
+
+def detector_state(detector):
+    "the closure variables of a carry detector, e.g. predigit and carries"
+    cells = detector.__closure__ or ()
+    return {name: cell.cell_contents for name, cell in zip(detector.__code__.co_freevars, cells)}
+
+
+def restore_detector_state(detector, state):
+    cells = detector.__closure__ or ()
+    for name, cell in zip(detector.__code__.co_freevars, cells):
+        if name in state:
+            cell.cell_contents = state[name]
+
+
+def save_spigot_state(state, path):
+    a = state.a if isinstance(state.a, array) else array("Q", state.a)
+    with open(path + ".tmp", "wb") as state_file:
+        state_file.write(_state_header.pack(
+            _state_magic, _state_version, state.radix, state.n,
+            state.iteration, state.digits_remaining, state.active_len,
+        ))
+        state_file.write(_state_length.pack(len(state.detector)))
+        for name, value in state.detector.items():
+            encoded = name.encode()
+            state_file.write(_state_var.pack(len(encoded), value is None, value or 0))
+            state_file.write(encoded)
+        state_file.write(a.typecode.encode())
+        state_file.write(_state_length.pack(len(a)))
+        a.tofile(state_file)
+        state_file.write(_state_length.pack(len(state.output)))
+        state_file.write(state.output)
+    # replace the previous checkpoint only once this one is complete
+    os.replace(path + ".tmp", path)
+
+
+def load_spigot_state(path):
+    with open(path, "rb") as state_file:
+        magic, version, radix, n, iteration, digits_remaining, active_len = \
+            _state_header.unpack(state_file.read(_state_header.size))
+        if magic != _state_magic or version != _state_version:
+            raise ValueError(f"{path} is not a spigot checkpoint")
+        (count,) = _state_length.unpack(state_file.read(_state_length.size))
+        detector = {}
+        for _ in range(count):
+            name_len, is_none, value = _state_var.unpack(state_file.read(_state_var.size))
+            detector[state_file.read(name_len).decode()] = None if is_none else value
+        typecode = state_file.read(1).decode()
+        (length,) = _state_length.unpack(state_file.read(_state_length.size))
+        a = array(typecode)
+        a.fromfile(state_file, length)
+        (length,) = _state_length.unpack(state_file.read(_state_length.size))
+        output = state_file.read(length)
+    return SpigotState(radix, n, iteration, digits_remaining, active_len, a, detector, output)
+
+
+@dataclass
+class TapeStats:
+    passes: int = 0
+    segments: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    peak_bytes: int = 0
+
+
+def compute_pi_digits_tape(n, radix = 10, segment_len = 1024, tape_dir = None, stats = None):
+    """
+    same digits as compute_pi_digits, with the array a held on two tape files
+    each pass reads one tape from high i to low i, one segment at a time,
+    and writes the new remainders to the other tape in the same order
+    """
 
-    n = 250
-    radix = 100
-    if len(sys.argv) > 1:
-        n = int(sys.argv[1])
-    if len(sys.argv) > 2:
-        radix = int(sys.argv[2])
-
-    digits = compute_pi_digits(n+1, radix)
-    print(f"{digits[0]}.")
-    remaining = digits[1:n + 1]
-    for i in range(0, len(remaining), 10):
-        group = remaining[i:i+10]
+    const_log_radix = int(math.log10(radix))
+    const_init = radix // 5
+    digits_remaining = const_log_radix + n + 3 # bits stuck in carry detection buffer
+    const_array_len = int(((digits_remaining // const_log_radix) + 1) * 14)
+    stage = DigitStage(radix, carry_detector, digits_remaining + 2 * const_log_radix)
+    stats = stats if stats is not None else TapeStats()
+
+    # segment k holds a[i] for i in (k * segment_len, (k + 1) * segment_len], highest i first
+    segment_count = (const_array_len + segment_len - 1) // segment_len
+    stats.segments = segment_count
+    item_size = array("q").itemsize
+
+    with tempfile.TemporaryDirectory(dir=tape_dir) as tapes:
+        tape_in = os.path.join(tapes, "a.tape")
+        tape_out = os.path.join(tapes, "b.tape")
+
+        first_pass = True
+
+        # main loop
+        while digits_remaining >= 0:
+
+            stats.passes += 1
+            quotient = 0
+
+            with (nullcontext(None) if first_pass else open(tape_in, "rb")) as reader, open(tape_out, "wb") as punch:
+                for k in reversed(range(segment_count)):
+                    low = k * segment_len + 1
+                    high = min((k + 1) * segment_len, const_array_len)
+                    if first_pass:
+                        # first pass: a is not on tape yet, every a[i] is const_init
+                        segment = array("q", [const_init]) * (high - low + 1)
+                    else:
+                        segment = array("q")
+                        segment.fromfile(reader, high - low + 1)
+                        stats.bytes_read += len(segment) * item_size
+                    stats.peak_bytes = max(stats.peak_bytes, len(segment) * item_size)
+
+                    # segment[0] is a[high], segment[-1] is a[low]
+                    i = high
+                    for index in range(len(segment)):
+                        new_quotient, new_remainder = main_inner(radix, segment[index], quotient, i)
+                        quotient = new_quotient
+                        segment[index] = new_remainder
+                        i = i - 1
+
+                    if k == 0:
+                        # divide by radix to extract digits, a[1] is the last element on tape
+                        new_quotient, remainder = divmod_local(quotient, radix)
+                        segment[-1] = remainder
+
+                    segment.tofile(punch)
+                    stats.bytes_written += len(segment) * item_size
+
+            first_pass = False
+            tape_in, tape_out = tape_out, tape_in
+
+            # output processing for quotient
+            digits_remaining -= stage.release(new_quotient)
+
+    return list(stage.view())
+
+
+def print_digits(digits, n):
+    "print the first n + 1 digits, 10 to a group, 50 to a line; digits may be any iterable"
+    digits = iter(digits)
+    print(f"{next(digits)}.")
+    for i in range(0, n, 10):
+        group = list(islice(digits, min(10, n - i)))
+        if not group:
+            break
         print(''.join(map(str, group)), end=' ')
         if (i + 10) % 50 == 0: # line for every 50 digits
             print()
         if (i + 10) % 1000 == 0: # paragraph every 1000 digits
             print()
     print()
+
+
+def main(commandline):
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument("n", help="Number of digits", type=int, nargs="?", default=250)
+    arg_parser.add_argument("radix", help="Radix, a power of 10", type=int, nargs="?", default=100)
+    arg_parser.add_argument("--shrink", help="Drop trailing terms that can no longer affect the remaining digits", action="store_true", default=False)
+    arg_parser.add_argument("--checkpoint", help="Save the state to this file every --checkpoint_every passes", required=False)
+    arg_parser.add_argument("--checkpoint_every", help="Passes between checkpoints", type=int, default=100)
+    arg_parser.add_argument("--resume", help="Continue from a checkpoint; n and radix come from it", required=False)
+    arg_parser.add_argument("--tape", help="Keep the array on tape files instead of in memory", action="store_true", default=False)
+    arg_parser.add_argument("--segment_len", help="Array elements held in memory at once in tape mode", type=int, default=1024)
+    arg_parser.add_argument("--tape_dir", help="Directory for tape files in tape mode", required=False)
+    arg_parser.add_argument("--divmod", help="Division: python divmod, or a model of the EDSAC repeated subtraction or shift and subtract routine, counting its orders", choices=divmod_choices, default="py")
+    arg_parser.add_argument("--cost", help="Estimate the orders and EDSAC time pi_mem.asm would take for this run", action="store_true", default=False)
+    arg_parser.add_argument("--cost_csv", help="With --cost, write the cost of each pass to this CSV file", required=False)
+    arg_parser.add_argument("--fixed_width", help="Wrap values at pi_mem.asm's 35 and 17 bit words, reporting overflows and headroom", action="store_true", default=False)
+    args = arg_parser.parse_args(commandline)
+    n = args.n
+    radix = args.radix
+    if args.cost and (args.resume or args.checkpoint):
+        arg_parser.error("--cost does not combine with checkpoints")
+    if args.fixed_width and (args.cost or args.resume or args.checkpoint):
+        arg_parser.error("--fixed_width does not combine with --cost or checkpoints")
+    if args.tape and (args.resume or args.checkpoint):
+        arg_parser.error("--tape does not combine with checkpoints")
+
+    if args.divmod == "shift" and not divmod_shift_fits(radix):
+        arg_parser.error(f"the {DIVMOD_SHIFT_BITS} bit .divmod_shift cannot divide for radix {radix}, "
+                         f"its quotients reach {radix * (radix + 12) - 1}")
+
+    global divmod_local
+    divmod_local = divmod_choices[args.divmod]
+
+    cost = SpigotCost()
+    widths = WordWidths()
+    with instrument(cost) if args.cost else fixed_width(widths) if args.fixed_width else nullcontext():
+        if args.tape:
+            stats = TapeStats()
+            digits = compute_pi_digits_tape(n+1, radix, args.segment_len, args.tape_dir, stats)
+            print(
+                f"tape: {stats.passes} passes over {stats.segments} segments, "
+                f"{stats.bytes_read} bytes read, {stats.bytes_written} bytes written, "
+                f"peak window {stats.peak_bytes} bytes",
+                file=sys.stderr,
+            )
+        else:
+            # a checkpoint keeps the shrunk array length, so --shrink resumes where it left off
+            resume = load_spigot_state(args.resume) if args.resume else None
+            if resume is not None:
+                n, radix = resume.n - 1, resume.radix
+            stats = SpigotStats() if args.shrink else None
+            digits = iter_pi_digits(radix, n+1, shrink=args.shrink, stats=stats, resume=resume,
+                                    checkpoint=args.checkpoint, checkpoint_every=args.checkpoint_every)
+        print_digits(digits, n)
+        if args.cost or args.fixed_width or args.shrink:
+            # the run goes on past the digits printed until the digit count runs out
+            for _ in digits:
+                pass
+        if args.shrink and not args.tape:
+            print(
+                f"shrink: {stats.inner_steps} inner steps over {stats.passes} passes, "
+                f"full array {stats.full_steps} ({stats.inner_steps / stats.full_steps:.1%})",
+                file=sys.stderr,
+            )
+    if divmod_count.calls:
+        print(
+            f"divmod: {divmod_count.calls} calls, {divmod_count.orders} orders, "
+            f"{divmod_count.orders / divmod_count.calls:.1f} per call",
+            file=sys.stderr,
+        )
+    if args.fixed_width:
+        print(f"fixed width: {widths}", file=sys.stderr)
+    if args.cost:
+        print(f"cost: {cost}", file=sys.stderr)
+        if args.cost_csv:
+            cost.write_csv(args.cost_csv)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+wavefront-pipelined spigot across worker processes
+
+the array a is split into contiguous segments, highest i first, one per
+worker. pass k hands a single quotient carry from high i to low i, and
+pass k+1 on a segment only needs that segment's remainders from pass k,
+so a worker starts its next pass as soon as it has passed its carry on.
+the worker holding a[1] extracts the superdigit and sends the quotient
+to the parent, which releases digits through a DigitStage exactly as
+compute_pi_digits. carries go through rings of int64 slots in shared
+memory, so none is pickled. an exception in a worker is put on the error
+queue and passed down the rings as FAILED in place of a carry, and raised
+again in the parent, which then terminates the workers.
+
+usage:
+    python3 spigot_parallel.py 2000 100 --workers 4
+"""
+import math
+import multiprocessing
+import os
+import sys
+from argparse import ArgumentParser
+from multiprocessing import shared_memory
+
+import spigot_edsac
+
+# carries in flight between two neighbouring workers
+RING_DEPTH = 64
+# in place of a carry; carries are never negative
+STOP = -1
+FAILED = -2
+
+
+class CarryRing:
+    "carries from one worker to the next, in a ring of int64 slots in shared memory"
+
+    def __init__(self, context, depth = RING_DEPTH):
+        self.memory = shared_memory.SharedMemory(create=True, size=8 * depth)
+        self.depth = depth
+        self.free = context.Semaphore(depth)
+        self.filled = context.Semaphore(0)
+        # each end keeps its own position; the semaphores order the slots
+        self.put_index = 0
+        self.get_index = 0
+        self.slots = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["slots"] = None
+        return state
+
+    def put(self, carry):
+        if self.slots is None:
+            self.slots = self.memory.buf.cast("q")
+        self.free.acquire()
+        self.slots[self.put_index] = carry
+        self.put_index = (self.put_index + 1) % self.depth
+        self.filled.release()
+
+    def get(self):
+        if self.slots is None:
+            self.slots = self.memory.buf.cast("q")
+        self.filled.acquire()
+        carry = self.slots[self.get_index]
+        self.get_index = (self.get_index + 1) % self.depth
+        self.free.release()
+        return carry
+
+    def close(self):
+        if self.slots is not None:
+            self.slots.release()
+            self.slots = None
+        self.memory.close()
+
+
+def segment_worker(low, high, radix, const_init, carry_in, carry_out, stop, errors, divmod_impl):
+    "run passes over a[low..high] until the parent stops the top worker"
+    try:
+        segment_passes(low, high, radix, const_init, carry_in, carry_out, stop, divmod_impl)
+    except Exception as error:
+        errors.put(error)
+        carry_out.put(FAILED)
+    finally:
+        for ring in (carry_in, carry_out):
+            if ring is not None:
+                ring.close()
+
+
+def segment_passes(low, high, radix, const_init, carry_in, carry_out, stop, divmod_impl):
+    spigot_edsac.divmod_local = divmod_impl
+    main_inner = spigot_edsac.main_inner
+    # a[i] is kept at a[i - low]
+    a = [const_init] * (high - low + 1)
+
+    while True:
+        if carry_in is None:
+            # top segment: every pass starts with quotient 0
+            if stop.is_set():
+                carry_out.put(STOP)
+                return
+            quotient = 0
+        else:
+            quotient = carry_in.get()
+            if quotient < 0:
+                # stopping, or a worker above failed
+                carry_out.put(quotient)
+                return
+
+        i = high
+        while i >= low:
+            quotient, a[i - low] = main_inner(radix, a[i - low], quotient, i)
+            i = i - 1
+
+        if low == 1:
+            # divide by radix to extract digits, save remainder to a[1]
+            quotient, a[0] = spigot_edsac.divmod_local(quotient, radix)
+
+        carry_out.put(quotient)
+
+
+def segment_bounds(const_array_len, workers):
+    "(low, high) per worker, highest segment first"
+    workers = max(1, min(workers, const_array_len))
+    size = math.ceil(const_array_len / workers)
+    bounds = []
+    high = const_array_len
+    while high >= 1:
+        low = max(1, high - size + 1)
+        bounds.append((low, high))
+        high = low - 1
+    return bounds
+
+
+def compute_pi_digits_parallel(n, radix = 10, workers = None):
+    "same digits as spigot_edsac.compute_pi_digits, with the i-loop pipelined over processes"
+
+    const_log_radix = int(math.log10(radix))
+    const_init = radix // 5
+    digits_remaining = const_log_radix + n + 3 # bits stuck in carry detection buffer
+    const_array_len = int(((digits_remaining // const_log_radix) + 1) * 14)
+    stage = spigot_edsac.DigitStage(radix, spigot_edsac.carry_detector, digits_remaining + 2 * const_log_radix)
+
+    bounds = segment_bounds(const_array_len, workers or os.cpu_count() or 1)
+    context = multiprocessing.get_context()
+    stop = context.Event()
+    errors = context.Queue()
+    rings = [CarryRing(context) for _ in bounds]
+    processes = []
+    try:
+        for index, (low, high) in enumerate(bounds):
+            carry_in = rings[index - 1] if index > 0 else None
+            process = context.Process(
+                target=segment_worker,
+                args=(low, high, radix, const_init, carry_in, rings[index], stop, errors, spigot_edsac.divmod_local),
+                daemon=True,
+            )
+            process.start()
+            processes.append(process)
+        results = rings[-1]
+
+        finished = False
+        try:
+            while digits_remaining >= 0:
+                new_quotient = results.get()
+                if new_quotient == FAILED:
+                    raise errors.get()
+
+                # output processing for quotient
+                digits_remaining -= stage.release(new_quotient)
+            finished = True
+        finally:
+            # the top worker may be several passes ahead; drain until everyone has stopped
+            stop.set()
+            while finished:
+                carry = results.get()
+                if carry == STOP:
+                    break
+                if carry == FAILED:
+                    # workers above a failed one may be blocked on a full ring
+                    finished = False
+            for process in processes:
+                if not finished:
+                    process.terminate()
+                process.join()
+    finally:
+        for ring in rings:
+            ring.close()
+            ring.memory.unlink()
+
+    return list(stage.view())
+
+
+def main(commandline):
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument("n", help="Number of digits", type=int, nargs="?", default=250)
+    arg_parser.add_argument("radix", help="Radix, a power of 10", type=int, nargs="?", default=100)
+    arg_parser.add_argument("--workers", help="Worker processes, defaults to the CPU count", type=int, required=False)
+    args = arg_parser.parse_args(commandline)
+
+    digits = compute_pi_digits_parallel(args.n + 1, args.radix, args.workers)
+    spigot_edsac.print_digits(digits, args.n)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,4 +1,33 @@
+import mmap
+import os
 import sys
+import time
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from math import isqrt
+from typing import *
+
+# reference digits of pi for the checkers
+#
+# digits come from a cache file of ascii digits, "31415...", memory mapped
+# so checkers read slices of it. when a checker runs past the end, the
+# cache is recomputed with chudnovsky binary splitting at double the
+# length. the gibbons generator is kept as an independent check of the cache.
+
+DEFAULT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "obj", "pi_reference.digits")
+MIN_CACHE_DIGITS = 4096
+# extra digits computed and dropped, so truncation never reaches the kept digits
+GUARD_DIGITS = 20
+
+# bytes read from stdin at a time when checking
+CHUNK = 1 << 16
+_NOT_DIGITS = bytes(c for c in range(256) if not 48 <= c <= 57)
+
+# digits gained per chudnovsky term, log10(640320^3 / (24 * 6 * 2 * 6))
+DIGITS_PER_TERM = 14.181647462725477
+
+sys.set_int_max_str_digits(0)
+
 
 # generator for reference digits of pi using Gibbons algorithm
 # https://www.cs.ox.ac.uk/people/jeremy.gibbons/publications/spigot.pdf
@@ -12,9 +41,224 @@ def pi_digits():
   else:
       q,r,t,k,n,l = q*k, (2*q+r)*l, t*l, k+1, (q*(7*k+2)+r*l)//(t*l), l+2
 
-reference_stream = pi_digits()
 
-while(c := sys.stdin.read(1)):
-    if c.isdigit():
-        ref = next(reference_stream)
-        print(ref if ref == int(c) else "X", end="", flush=1)
\ No newline at end of file
+# chudnovsky series by binary splitting
+# https://www.craig-wood.com/nick/articles/pi-chudnovsky/
+
+_C3_OVER_24 = 640320 ** 3 // 24
+
+
+def _split(a, b):
+    "P, Q, T for terms a..b-1"
+    if b - a == 1:
+        if a == 0:
+            p = q = 1
+        else:
+            p = (6 * a - 5) * (2 * a - 1) * (6 * a - 1)
+            q = a * a * a * _C3_OVER_24
+        t = p * (13591409 + 545140134 * a)
+        if a & 1:
+            t = -t
+        return p, q, t
+    m = (a + b) // 2
+    p_am, q_am, t_am = _split(a, m)
+    p_mb, q_mb, t_mb = _split(m, b)
+    return p_am * p_mb, q_am * q_mb, q_mb * t_am + p_am * t_mb
+
+
+def chudnovsky_digits(count):
+    "the first count digits of pi as ascii bytes, starting with the 3"
+    precision = count + GUARD_DIGITS
+    terms = int(precision / DIGITS_PER_TERM) + 1
+    _, q, t = _split(0, terms)
+    one = 10 ** precision
+    pi = (q * 426880 * isqrt(10005 * one * one)) // t
+    return str(pi)[:count].encode("ascii")
+
+
+class ReferenceCache:
+    "digits of pi in a memory mapped file, extended on demand"
+
+    def __init__(self, path = DEFAULT_CACHE):
+        self.path = path
+        self._file = None
+        self._map = None
+        self.length = 0
+        self._open()
+
+    def _open(self):
+        self.close()
+        if not os.path.exists(self.path):
+            return
+        self._file = open(self.path, "rb")
+        self.length = os.fstat(self._file.fileno()).st_size
+        if self.length:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def ensure(self, count):
+        "make sure the cache holds at least count digits"
+        if count <= self.length:
+            return
+        count = max(count, 2 * self.length, MIN_CACHE_DIGITS)
+        digits = chudnovsky_digits(count)
+        if self._map is not None and digits[:self.length] != self._map[:]:
+            raise ValueError(f"{self.path} disagrees with freshly computed digits")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # other checkers may have the old cache mapped, so replace rather than rewrite
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as cache_file:
+            cache_file.write(digits)
+        os.replace(temp_path, self.path)
+        self._open()
+
+    def slice(self, start, stop):
+        "digits start..stop-1 as ascii bytes"
+        self.ensure(stop)
+        return self._map[start:stop]
+
+    def stream(self, start = 0, chunk = 4096):
+        "digits as ints from start, growing the cache as they are used"
+        position = start
+        while True:
+            for digit in self.slice(position, position + chunk):
+                yield digit - 48
+            position += chunk
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.length = 0
+
+
+def verify_cache(cache, count):
+    "offset of the first cached digit the gibbons generator disagrees with, or None"
+    for offset, (cached, ref) in enumerate(zip(cache.slice(0, count), pi_digits())):
+        if cached - 48 != ref:
+            return offset
+    return None
+
+
+def gibbons_reader():
+    "take(count) for the gibbons generator, as ascii bytes"
+    digits = pi_digits()
+    return lambda count: bytes(48 + next(digits) for _ in range(count))
+
+
+def cache_reader(cache):
+    "take(count) for successive slices of the cache"
+    position = 0
+
+    def take(count):
+        nonlocal position
+        chunk = cache.slice(position, position + count)
+        position += count
+        return chunk
+
+    return take
+
+
+def digit_chunks(stream, chunk = CHUNK):
+    "digits from a binary stream, whatever has arrived, up to chunk bytes at a time"
+    read = getattr(stream, "read1", stream.read)
+    while data := read(chunk):
+        digits = data.translate(None, _NOT_DIGITS)
+        if digits:
+            yield digits
+
+
+def mark_chunk(digits, ref):
+    "digits with X wherever they differ from ref"
+    if digits == ref:
+        return digits
+    return bytes(d if d == r else 88 for d, r in zip(digits, ref))
+
+
+@dataclass
+class CheckResult:
+    digits: int = 0
+    mismatches: int = 0
+    first_mismatch: Optional[int] = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self):
+        return self.digits > 0 and self.mismatches == 0
+
+    @property
+    def digits_per_s(self):
+        return self.digits / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        if not self.digits:
+            return "no digits to check"
+        if self.mismatches:
+            verdict = f"{self.mismatches} mismatches, first at digit {self.first_mismatch}"
+        else:
+            verdict = "all match"
+        return f"{self.digits} digits checked, {verdict} ({self.digits_per_s:.0f} digits/s)"
+
+
+def check_chunks(chunks, take, mark = None):
+    "compare digit chunks with the reference; mark, when given, is called with each marked chunk"
+    result = CheckResult()
+    started = time.perf_counter()
+    for digits in chunks:
+        ref = take(len(digits))
+        if digits != ref:
+            for offset, (d, r) in enumerate(zip(digits, ref)):
+                if d != r:
+                    if result.first_mismatch is None:
+                        result.first_mismatch = result.digits + offset
+                    result.mismatches += 1
+        if mark is not None:
+            mark(mark_chunk(digits, ref))
+        result.digits += len(digits)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def main(commandline):
+    arg_parser = ArgumentParser(description="Mark digits of pi read from stdin, X where they differ from the reference")
+    arg_parser.add_argument("--cache", help="Reference digit cache file", default=DEFAULT_CACHE)
+    arg_parser.add_argument("--gibbons", help="Compare against the Gibbons generator instead of the cache", action="store_true")
+    arg_parser.add_argument("--extend", help="Extend the cache to this many digits and exit", type=int, required=False)
+    arg_parser.add_argument("--verify", help="Check this many cached digits against the Gibbons generator and exit", type=int, required=False)
+    arg_parser.add_argument("--check", help="Report the first divergence and mismatch count, exit 1 on failure", action="store_true")
+    arg_parser.add_argument("--mark", help="With --check, also print the digits marked with X", action="store_true")
+    args = arg_parser.parse_args(commandline)
+
+    cache = ReferenceCache(args.cache)
+    if args.extend is not None or args.verify is not None:
+        if args.extend is not None:
+            cache.ensure(args.extend)
+            print(f"{cache.path}: {cache.length} digits")
+        if args.verify is not None:
+            offset = verify_cache(cache, args.verify)
+            if offset is not None:
+                print(f"{cache.path}: digit {offset} differs from the Gibbons generator")
+                sys.exit(1)
+            print(f"{cache.path}: first {args.verify} digits agree with the Gibbons generator")
+        return
+
+    take = gibbons_reader() if args.gibbons else cache_reader(cache)
+    out = sys.stdout.buffer
+
+    def mark(marked):
+        out.write(marked)
+        out.flush()
+
+    result = check_chunks(digit_chunks(sys.stdin.buffer), take, mark if args.mark or not args.check else None)
+    if args.check:
+        if args.mark:
+            out.write(b"\n")
+            out.flush()
+        print(result, file=sys.stderr if args.mark else sys.stdout)
+        sys.exit(0 if result.ok else 1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
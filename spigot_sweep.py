@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+sweep spigot configurations across worker processes
+
+every combination of digits, radix, array length, carry detector and divmod
+routine is run through spigot_edsac.py, its digits checked against the
+reference, its intermediate values checked against EDSAC's 17 and 35 bit
+words, its store footprint taken from pi_mem.asm as assembled with that
+divmod, and its EDSAC time estimated with the cost model.
+
+usage:
+    python3 spigot_sweep.py
+    python3 spigot_sweep.py --digits 100 252 500 --radix 10 100 --array_len 0 842 --csv sweep.csv
+"""
+import csv
+import itertools
+import multiprocessing
+import os
+import re
+import sys
+import time
+from argparse import ArgumentParser
+from dataclasses import dataclass, field, fields
+
+import spigot_edsac
+from edsac import load_image
+from edsac.orders import MEMSIZE
+from spigot_reference import DEFAULT_CACHE, ReferenceCache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "asm"))
+import asm
+
+PI_MEM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "pi_mem.asm")
+
+# pi_mem.asm has the minimal detector; the others are sized and costed as if they were it
+DETECTORS = {
+    "minimal": spigot_edsac.carry_detector1,
+    "general": spigot_edsac.carry_detector_general,
+    "none": spigot_edsac.carry_detector0,
+}
+# the routine pi_mem.asm would call; "slow" runs as python divmod, which gives the same results
+DIVMODS = {
+    "slow": spigot_edsac.divmodpy,
+    "shift": spigot_edsac.divmod_shift,
+}
+
+# largest value a short word holds
+SHORT_MAX = (1 << 16) - 1
+
+
+@dataclass
+class SweepResult:
+    digits: int
+    radix: int
+    array_len: int
+    detector: str
+    divmod: str
+    produced: int = 0
+    first_mismatch: int = -1
+    overflows: list = field(default_factory=list)
+    # largest values in pi_mem.asm's words
+    max_numerator: int = 0
+    max_pass_quotient: int = 0
+    max_element: int = 0
+    orders: int = 0
+    machine_hours: float = 0.0
+    seconds: float = 0.0
+    # from the assembled program, filled in by the parent
+    code_words: int = 0
+    free_words: int = 0
+
+    @property
+    def correct(self):
+        return self.first_mismatch < 0
+
+    @property
+    def fits(self):
+        return self.free_words >= 0
+
+    @property
+    def feasible(self):
+        return self.correct and not self.overflows and self.fits
+
+
+def program_source(divmod_name):
+    "pi_mem.asm, calling the .divmod_shift library routine instead of .divmod for shift"
+    with open(PI_MEM, "r") as source_file:
+        source_txt = source_file.read()
+    if divmod_name == "shift":
+        start = source_txt.index("def_proc .divmod:")
+        end = source_txt.index("ret_proc .divmod") + len("ret_proc .divmod")
+        source_txt = source_txt[:start] + 'include "lib/divmod_shift.asm"' + source_txt[end:]
+        source_txt = re.sub(r"call(\s+)\.divmod\b", r"call\1.divmod_shift", source_txt)
+    return source_txt
+
+
+def program_layout(divmod_name):
+    "(array start, code words) of pi_mem.asm with this divmod, the code packed against the top of the store"
+    # assemble low down with no array, so a program that has grown still assembles
+    params = {"code_org": asm.Visit.default_org, "array_len": 0}
+    _, _, image = asm.assemble(program_source(divmod_name), source_name=PI_MEM, params=params)
+    program = load_image(image)
+    code_words = max(program.loaded) - min(program.loaded) + 1
+    return program.symbols[".array_start"], code_words
+
+
+def run_config(config):
+    "run one configuration to the end, checking its digits and word widths"
+    digits, radix, array_len, detector_name, divmod_name, cache_path = config
+    result = SweepResult(digits, radix, array_len, detector_name, divmod_name)
+    spigot_edsac.carry_detector = DETECTORS[detector_name]
+    spigot_edsac.divmod_local = DIVMODS[divmod_name]
+
+    if not array_len:
+        log_radix = len(str(radix)) - 1
+        result.array_len = ((log_radix + digits + 3) // log_radix + 1) * 14
+    if result.array_len > SHORT_MAX:
+        result.overflows.append("array length over 17 bits")
+
+    started = time.perf_counter()
+    cost = spigot_edsac.SpigotCost()
+    output = bytearray()
+    with spigot_edsac.instrument(cost):
+        try:
+            for digit in spigot_edsac.iter_pi_digits(radix, digits, array_len=array_len or None):
+                output.append(48 + digit)
+        except ValueError as error:
+            # .divmod_shift cannot hold the quotient
+            result.overflows.append(str(error))
+    result.produced = len(output)
+    result.orders = cost.orders
+    result.machine_hours = cost.machine_ms() / 3_600_000
+
+    # again in pi_mem.asm's word widths, which say what must fit a short word
+    widths = spigot_edsac.WordWidths()
+    with spigot_edsac.fixed_width(widths):
+        try:
+            for _ in spigot_edsac.iter_pi_digits(radix, digits, array_len=array_len or None):
+                pass
+        except ValueError:
+            pass
+    for quantity, (peak, bits) in widths.peaks.items():
+        if spigot_edsac.wrap(peak, bits) != peak:
+            result.overflows.append(f"{quantity} over {bits} bits")
+    result.max_numerator, _ = widths.peaks.get("numerator", (0, 0))
+    result.max_pass_quotient, _ = widths.peaks.get("pass quotient", (0, 0))
+    result.max_element, _ = widths.peaks.get("a[i]", (0, 0))
+    result.seconds = time.perf_counter() - started
+
+    reference = ReferenceCache(cache_path)
+    checked = bytes(output[:digits])
+    expected = reference.slice(0, digits)
+    reference.close()
+    if checked != expected:
+        result.first_mismatch = next(
+            (offset for offset, (d, r) in enumerate(zip(checked, expected)) if d != r),
+            len(checked),
+        )
+    return result
+
+
+def report_line(result):
+    check = "ok" if result.correct else f"digit {result.first_mismatch}"
+    overflow = "; ".join(result.overflows) or "-"
+    return (
+        f"{result.digits:>7} {result.radix:>6} {result.array_len:>7} {result.detector:>8} {result.divmod:>6} "
+        f"{check:>11} {result.free_words:>6} {result.orders:>15} {result.machine_hours:>10.2f}  {overflow}"
+    )
+
+
+def write_csv(results, path):
+    names = [f.name for f in fields(SweepResult)]
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(names + ["feasible"])
+        for result in results:
+            row = [getattr(result, name) for name in names]
+            row[names.index("overflows")] = "; ".join(result.overflows)
+            writer.writerow(row + [result.feasible])
+
+
+def main(commandline):
+    arg_parser = ArgumentParser(description="Run spigot configurations in parallel and report which are correct, fit in the store, and what they cost")
+    arg_parser.add_argument("--digits", help="Digits to compute", type=int, nargs="+", default=[100, 252, 500])
+    arg_parser.add_argument("--radix", help="Radixes, powers of 10", type=int, nargs="+", default=[10, 100, 1000])
+    arg_parser.add_argument("--array_len", help="Array lengths, 0 to derive from the digits", type=int, nargs="+", default=[0])
+    arg_parser.add_argument("--detector", help="Carry detectors", nargs="+", choices=DETECTORS, default=["minimal"])
+    arg_parser.add_argument("--divmod", help="Divmod routines", nargs="+", choices=DIVMODS, default=list(DIVMODS))
+    arg_parser.add_argument("--workers", help="Worker processes, defaults to the CPU count", type=int, required=False)
+    arg_parser.add_argument("--cache", help="Reference digit cache file", default=DEFAULT_CACHE)
+    arg_parser.add_argument("--csv", help="Also write every result to this CSV file", required=False)
+    args = arg_parser.parse_args(commandline)
+
+    # extend the reference once, before the workers map it
+    ReferenceCache(args.cache).ensure(max(args.digits))
+    layouts = {divmod_name: program_layout(divmod_name) for divmod_name in args.divmod}
+
+    configs = list(itertools.product(args.digits, args.radix, args.array_len, args.detector, args.divmod, [args.cache]))
+    print(f"{'digits':>7} {'radix':>6} {'array':>7} {'detector':>8} {'divmod':>6} "
+          f"{'check':>11} {'free':>6} {'orders':>15} {'hours':>10}  overflow")
+    results = []
+    with multiprocessing.get_context().Pool(args.workers) as pool:
+        for result in pool.imap_unordered(run_config, configs):
+            array_start, result.code_words = layouts[result.divmod]
+            # the array runs from array_start + 1, the code ends at the top of the store
+            result.free_words = MEMSIZE - result.code_words - (array_start + result.array_len + 1)
+            print(report_line(result), flush=True)
+            results.append(result)
+
+    if args.csv:
+        write_csv(results, args.csv)
+    feasible = [result for result in results if result.feasible]
+    if feasible:
+        best = max(feasible, key=lambda result: (result.digits, -result.orders))
+        print(f"best: {best.digits} digits, radix {best.radix}, array {best.array_len}, {best.detector} detector, "
+              f"{best.divmod} divmod, {best.free_words} words free, {best.machine_hours:.2f} hours")
+    else:
+        print("no configuration is correct, free of overflow and fits in the store")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+run spigot_edsac.py and pi_mem.asm in lockstep, reporting where they first differ
+
+both sides give a snapshot per step of the i loop, (iteration, i, quotient,
+remainder, predigit, carries), and one per pass with i = 0 for the division
+by the radix: the superdigit, a[1] and the carry detector state before the
+superdigit goes in. the model's come from hooks on main_inner, divmod_local
+and the carry detector; the emulator's from breakpoints at
+.main_inner_returned and .main_radix_divided, with values read from the
+store at the addresses in the symbol listing. the model is run with the
+radix, array length and digit count assembled into the program.
+
+the last --history snapshots of each side are kept in a ring buffer of
+packed arrays and printed with the first mismatch.
+
+usage:
+    python3 spigot_trace.py obj/pi_mem.e
+    python3 spigot_trace.py obj/pi_mem.e -l obj/pi_mem.lst --history 16
+"""
+import math
+import sys
+from argparse import ArgumentParser
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from typing import *
+
+import spigot_edsac
+from edsac import BreakpointMachine, load_listing, load_program
+
+# predigit before the detector has seen its first superdigit
+NO_PREDIGIT = -1
+
+
+class TraceRing:
+    "the last capacity snapshots, as packed arrays"
+
+    fields = ("iteration", "i", "quotient", "remainder", "predigit", "carries")
+    typecodes = ("I", "I", "q", "q", "q", "I")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = [array(typecode, [0]) * capacity for typecode in self.typecodes]
+        self.count = 0
+
+    def append(self, snapshot):
+        slot = self.count % self.capacity
+        for column, value in zip(self.columns, snapshot):
+            column[slot] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def __iter__(self):
+        "oldest first"
+        for position in range(self.count - len(self), self.count):
+            slot = position % self.capacity
+            yield tuple(column[slot] for column in self.columns)
+
+
+def format_snapshot(snapshot):
+    return " ".join(f"{name}={value}" for name, value in zip(TraceRing.fields, snapshot))
+
+
+@contextmanager
+def model_hooks(pending):
+    "append each step of spigot_edsac's model to pending as a snapshot"
+    main_inner, divmod_local, detector_factory = spigot_edsac.main_inner, spigot_edsac.divmod_local, spigot_edsac.carry_detector
+    state = {"iteration": 1, "detector": None, "i": 0}
+
+    def carry():
+        detector = spigot_edsac.detector_state(state["detector"]) if state["detector"] is not None else {}
+        predigit = detector.get("predigit")
+        return NO_PREDIGIT if predigit is None else predigit, detector.get("carries", 0)
+
+    def traced_inner(radix, remainder, quotient, i):
+        state["i"] = i
+        new_quotient, new_remainder = main_inner(radix, remainder, quotient, i)
+        state["i"] = 0
+        pending.append((state["iteration"], i, new_quotient, new_remainder, *carry()))
+        return new_quotient, new_remainder
+
+    def traced_divmod(numerator, denominator):
+        quotient, remainder = divmod_local(numerator, denominator)
+        if state["i"] == 0:
+            # outside main_inner: the division by the radix that ends a pass
+            pending.append((state["iteration"], 0, quotient, remainder, *carry()))
+            state["iteration"] += 1
+        return quotient, remainder
+
+    def traced_detector(radix):
+        state["detector"] = detector_factory(radix)
+        return state["detector"]
+
+    spigot_edsac.main_inner, spigot_edsac.divmod_local, spigot_edsac.carry_detector = traced_inner, traced_divmod, traced_detector
+    try:
+        yield
+    finally:
+        spigot_edsac.main_inner, spigot_edsac.divmod_local, spigot_edsac.carry_detector = main_inner, divmod_local, detector_factory
+
+
+def model_snapshots(radix, n, array_len):
+    "snapshots of spigot_edsac's model, a pass at a time"
+    pending = deque()
+    with model_hooks(pending):
+        for _ in spigot_edsac.iter_pi_chunks(radix, n, array_len=array_len):
+            while pending:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+
+def program_constants(machine, symbols):
+    "(radix, array_len, digits remaining, array init) as assembled"
+    return (
+        machine.read_long(symbols[".const_radix"]),
+        machine.read_short(symbols[".const_array_len"]),
+        machine.read_short(symbols[".var_digits_remaining"]),
+        machine.read_short(symbols[".const_array_init"]),
+    )
+
+
+def emulator_snapshots(machine, symbols, max_orders = None):
+    "snapshots of the emulated program at .main_inner_returned and .main_radix_divided"
+    step, divided = symbols[".main_inner_returned"], symbols[".main_radix_divided"]
+    var_i, var_quotient, var_remainder = symbols[".var_i"], symbols[".var_quotient"], symbols[".var_remainder"]
+    predigit, initialised = symbols[".carry_predigit"], symbols[".carry_detection_initialised"]
+    machine.set_breakpoint(step)
+    machine.set_breakpoint(divided)
+    iteration = 1
+    while True:
+        budget = None if max_orders is None else max_orders - machine.orders_executed
+        if budget is not None and budget <= 0:
+            return
+        addr = machine.run_to_breakpoint(budget)
+        if addr is None:
+            return
+        carry = machine.read_short(predigit) if machine.read_short(initialised) else NO_PREDIGIT
+        i = machine.read_short(var_i) if addr == step else 0
+        yield iteration, i, machine.read_long(var_quotient), machine.read_long(var_remainder), carry, 0
+        if addr == divided:
+            iteration += 1
+
+
+def first_divergence(model, emulator, history):
+    "(snapshots compared, model snapshot, emulator snapshot, model ring, emulator ring); the snapshots are None if they agree"
+    model_ring, emulator_ring = TraceRing(history), TraceRing(history)
+    compared = 0
+    for model_snapshot, emulator_snapshot in zip(model, emulator):
+        model_ring.append(model_snapshot)
+        emulator_ring.append(emulator_snapshot)
+        if model_snapshot != emulator_snapshot:
+            return compared, model_snapshot, emulator_snapshot, model_ring, emulator_ring
+        compared += 1
+    return compared, None, None, model_ring, emulator_ring
+
+
+def main(commandline):
+    arg_parser = ArgumentParser(description="Trace spigot_edsac.py and an assembled pi_mem program in lockstep and report the first difference")
+    arg_parser.add_argument("orders", help="Assembled orders (.e) or memory image (.img)")
+    arg_parser.add_argument("-l", "--listing", help="Symbol listing from asm.py -l, when the orders carry no symbols", required=False)
+    arg_parser.add_argument("--history", help="Snapshots of each side kept for the report", type=int, default=8)
+    arg_parser.add_argument("--max_orders", help="Stop the emulator after this many orders", type=int, required=False)
+    args = arg_parser.parse_args(commandline)
+
+    program = load_program(args.orders)
+    symbols = load_listing(args.listing) if args.listing else program.symbols
+    missing = [name for name in (".main_inner_returned", ".main_radix_divided", ".const_radix") if name not in symbols]
+    if missing:
+        arg_parser.error(f"no {', '.join(missing)} in the symbols; pass the listing with -l")
+
+    machine = BreakpointMachine.from_program(program)
+    machine.echo = False
+    radix, array_len, digits_remaining, array_init = program_constants(machine, symbols)
+    if array_init != radix // 5:
+        arg_parser.error(f"the model starts a[i] at radix // 5 = {radix // 5}, the program at {array_init}")
+    # the model counts the digits still to come from log10(radix) + n + 3
+    n = digits_remaining - int(math.log10(radix)) - 3
+    print(f"radix {radix}, array length {array_len}, {n} digits")
+
+    compared, model_snapshot, emulator_snapshot, model_ring, emulator_ring = first_divergence(
+        model_snapshots(radix, n, array_len), emulator_snapshots(machine, symbols, args.max_orders), args.history)
+    if model_snapshot is None:
+        print(f"{compared} snapshots agree, {machine.orders_executed} orders")
+        return
+
+    print(f"first difference at iteration {model_snapshot[0]}, i {model_snapshot[1]}, "
+          f"after {compared} matching snapshots and {machine.orders_executed} orders")
+    for name, model_value, emulator_value in zip(TraceRing.fields, model_snapshot, emulator_snapshot):
+        marker = "" if model_value == emulator_value else "  <-"
+        print(f"  {name:<10} model {model_value:>12}  emulator {emulator_value:>12}{marker}")
+    for title, ring in (("model", model_ring), ("emulator", emulator_ring)):
+        print(f"last {len(ring)} {title} snapshots:")
+        for snapshot in ring:
+            print(f"  {format_snapshot(snapshot)}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+check every implementation's digits at once against one reference
+
+runs the same pipelines as logic_check, check_cpp, check_pas,
+self_check_check and run_mem, each in its own thread reading its
+implementation's output as it streams. all of them take their reference
+digits from one memory mapped cache, so the reference is computed at most
+once, and the whole check takes as long as the slowest implementation.
+an implementation whose build tool is missing is skipped.
+
+usage:
+    python3 spigot_verify.py
+    python3 spigot_verify.py --only logic cpp
+"""
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import *
+
+from spigot_reference import DEFAULT_CACHE, CheckResult, ReferenceCache, check_chunks, digit_chunks
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PYTHON = sys.executable
+
+
+@dataclass
+class Implementation:
+    name: str
+    # command whose stdout is the digits, or a file of digits
+    command: Optional[list[str]] = None
+    source: Optional[str] = None
+    # make target built first, and the tool it needs
+    build: Optional[str] = None
+    requires: Optional[str] = None
+    # leading digits that are not pi, as cut -c 2- drops for spigot_pas
+    skip: int = 0
+
+
+# as the Makefile runs them
+IMPLEMENTATIONS = [
+    Implementation("logic", [PYTHON, "spigot_edsac.py"]),
+    Implementation("cpp", ["./spigot_cpp", "3001", "5"], build="spigot_cpp", requires="g++"),
+    Implementation("pas", ["./spigot_pas"], build="spigot_pas", requires="fpc", skip=1),
+    Implementation("self_check", source="digits_pi.txt"),
+    Implementation("run_mem", [PYTHON, "-m", "edsac", "--digits", "obj/pi_mem.e"], build="obj/pi_mem.e"),
+]
+
+
+@dataclass
+class VerifyResult:
+    name: str
+    check: Optional[CheckResult] = None
+    seconds: float = 0.0
+    returncode: int = 0
+    skipped: str = ""
+
+    @property
+    def ok(self):
+        return self.skipped != "" or (self.check is not None and self.check.ok and self.returncode == 0)
+
+    def __str__(self):
+        if self.skipped:
+            return f"{self.name:<11} skipped, {self.skipped}"
+        if self.check is None:
+            return f"{self.name:<11} failed to start, exit status {self.returncode}"
+        check = self.check
+        divergence = "-" if check.first_mismatch is None else str(check.first_mismatch)
+        status = "ok" if self.ok else f"FAILED, exit status {self.returncode}" if self.returncode else "FAILED"
+        return (f"{self.name:<11} {check.digits:>8} {check.digits_per_s:>12.0f} {divergence:>10} "
+                f"{self.seconds:>9.2f}  {status}")
+
+
+class SharedReference:
+    "one reference cache read by every checker, each from its own position"
+
+    def __init__(self, path = DEFAULT_CACHE):
+        self.cache = ReferenceCache(path)
+        self._lock = threading.Lock()
+
+    def reader(self):
+        "take(count) for successive slices of the reference"
+        position = 0
+
+        def take(count):
+            nonlocal position
+            # a slice past the end extends and remaps the cache, so one reader at a time
+            with self._lock:
+                chunk = self.cache.slice(position, position + count)
+            position += count
+            return chunk
+
+        return take
+
+    def close(self):
+        self.cache.close()
+
+
+def skip_digits(chunks, skip):
+    for digits in chunks:
+        if skip:
+            digits, skip = digits[skip:], max(0, skip - len(digits))
+        if digits:
+            yield digits
+
+
+def build(implementation):
+    "empty when the implementation is ready to run, else why it cannot"
+    if implementation.build is None:
+        return ""
+    if implementation.requires and shutil.which(implementation.requires) is None \
+            and not os.path.exists(os.path.join(HERE, implementation.build)):
+        return f"{implementation.requires} not found"
+    built = subprocess.run(["make", "-s", implementation.build], cwd=HERE, capture_output=True, text=True)
+    if built.returncode:
+        return f"make {implementation.build} failed: {built.stderr.strip().splitlines()[-1:] or built.returncode}"
+    return ""
+
+
+def verify(implementation, reference):
+    "build and run one implementation, checking its digits as they arrive"
+    result = VerifyResult(implementation.name)
+    result.skipped = build(implementation)
+    if result.skipped:
+        return result
+    started = time.perf_counter()
+    if implementation.source is not None:
+        with open(os.path.join(HERE, implementation.source), "rb") as stream:
+            result.check = check_chunks(skip_digits(digit_chunks(stream), implementation.skip), reference.reader())
+    else:
+        process = subprocess.Popen(implementation.command, cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            result.check = check_chunks(skip_digits(digit_chunks(process.stdout), implementation.skip), reference.reader())
+        finally:
+            process.stdout.close()
+            result.returncode = process.wait()
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def main(commandline):
+    names = [implementation.name for implementation in IMPLEMENTATIONS]
+    arg_parser = ArgumentParser(description="Check the digits of every implementation concurrently against one reference")
+    arg_parser.add_argument("--only", help="Implementations to check", nargs="+", choices=names, default=names)
+    arg_parser.add_argument("--cache", help="Reference digit cache file", default=DEFAULT_CACHE)
+    args = arg_parser.parse_args(commandline)
+
+    implementations = [implementation for implementation in IMPLEMENTATIONS if implementation.name in args.only]
+    reference = SharedReference(args.cache)
+    started = time.perf_counter()
+    results = []
+    print(f"{'name':<11} {'digits':>8} {'digits/s':>12} {'diverges':>10} {'seconds':>9}")
+    with ThreadPoolExecutor(len(implementations)) as pool:
+        futures = [pool.submit(verify, implementation, reference) for implementation in implementations]
+        for future in as_completed(futures):
+            result = future.result()
+            print(result, flush=True)
+            results.append(result)
+    wall = time.perf_counter() - started
+    reference.close()
+
+    run = [result for result in results if not result.skipped]
+    failed = [result.name for result in results if not result.ok]
+    print(f"{len(run)} checked, {len(results) - len(run)} skipped in {wall:.2f} s "
+          f"({sum(result.seconds for result in run):.2f} s one after another)")
+    if failed:
+        print(f"failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,55 @@
+;; restoring binary long division in a fixed number of steps
+;; include "lib/divmod_shift.asm" where the routine should be placed
+;;
+;; computes .var_numerator // .var_denominator, same interface as .divmod
+;; quotient is in .var_quotient
+;; remainder is in .var_remainder
+;; the quotient must be below 2^14; in the spigot it stays below
+;; radix * (radix + 12), the largest being at denominator 1
+;;
+;; the includer defines .var_numerator, .var_denominator, .var_quotient,
+;; .var_remainder and .const_1 as long words. numerator and denominator are
+;; overwritten, and the step count is kept in .var_quotient meanwhile
+;;
+;; the denominator is lined up 14 places above the numerator, then each step
+;; doubles the numerator and subtracts the denominator if it can, leaving a
+;; quotient bit at the bottom. after 14 steps the numerator holds
+;; remainder * 2^14 + quotient. 171 to 185 orders a call, where .divmod
+;; takes 10 + 8 * quotient
+
+.const_divmod_shift_steps: def_num 13 f         ; steps after the first
+def_proc .divmod_shift:
+        add             .var_denominator        d
+        lshift          1024                    f   ; 14 places up
+        lshift          1                       f
+        mov             .var_denominator        d
+        add             .const_divmod_shift_steps f
+        mov             .var_quotient           f   ; step count
+    .divmod_shift_step:
+        add             .var_numerator          d
+        lshift          0                       d   ; double
+        sub             .var_denominator        d
+        jlt             .divmod_shift_restore   f   ; denominator does not go
+        add             .const_1                d   ; quotient bit
+        jge             .divmod_shift_store     f
+    .divmod_shift_restore:
+        add             .var_denominator        d
+    .divmod_shift_store:
+        mov             .var_numerator          d
+        add             .var_quotient           f   ; count down the steps
+        sub             .const_1                f
+        jlt             .divmod_shift_end       f
+        mov             .var_quotient           f
+        jge             .divmod_shift_step      f
+    .divmod_shift_end:
+        mov             0                       f   ; clear accumulator
+        add             .var_numerator          d
+        rshift          1024                    f   ; 14 places down
+        rshift          1                       f
+        mov             .var_remainder          d
+        sub             .var_remainder          d
+        lshift          1024                    f
+        lshift          1                       f
+        add             .var_numerator          d   ; low 14 bits
+        mov             .var_quotient           d
+ret_proc .divmod_shift
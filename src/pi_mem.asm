@@ -5,11 +5,21 @@
 ; define entry point
 start .main
 
-; overwrite initial instructions to get more memory
-def_loc .array_start 4
+; radix and its log10, as printed by .output_superdigit
+def_param $radix 100
+def_param $radix_log 2
+; array_len and code_org as planned by: asm.py src/pi_mem.asm --plan array_len --write_params
+def_param $array_len 842
+def_param $code_org 847
+def_param $array_init ($radix / 5)
+; array_len / log2(10) digits
+def_param $digits ($array_len * 1000 / 3322)
+
+; overwrite initial instructions to get more memory, a[0..array_len]
+def_loc .array_start 4 ($array_len + 1)
 
 ; locate program in top memory against upper limit
-org 842
+org $code_org
 
 ;; print a superdigit of size log10(radix)
 .output_superdigit_param: def_num 0             f
@@ -73,10 +83,6 @@ ret_proc .carry_detector
 ; quotient is in .var_quotient
 ; remainder is is .var_remainder
 ;; warning: extremely slow
-.var_numerator:   def_num 0 d
-.var_denominator: def_num 0 d
-.var_quotient:    def_num 0 d
-.var_remainder:   def_num 0 d
 def_proc .divmod:
         mov             .var_quotient           d   ; initialize quotient to 0
     .divmod_loop:
@@ -161,6 +167,7 @@ def_proc .main:
 
         mov             .var_remainder          f   ; save a[i] (previous remainder)
         call            .main_inner                 ; call inner logic routine
+.main_inner_returned:
 
         ;; save new remainder to a[i]
         add             .var_i                  f   ; load i
@@ -186,6 +193,7 @@ def_proc .main:
         add             .const_radix            f   ; load radix
         mov             .var_denominator        f   ; set up denominator for divmod
         call            .divmod                     ; call divmod to get q div radix and q mod radix
+.main_radix_divided:
 
         ; a[1] = remainder
         add             .const_2                f   ; load constant 2
@@ -211,21 +219,24 @@ ret_proc .main
         .const_carriage_return: @    0          F   ; teleprinter char 3 carriage return
         .const_line_feed:       &    0          F   ; teleprinter char 4 line feed
 
+        .var_template_write: T       .array_start F ; template: transfer to array base
+        .var_template_read: A        .array_start F ; template: load from array base
+
         .const_1:        def_num     1          d   ; constant 1
         .const_2:        def_num     2          f   ; constant 2
         .const_10:       def_num     10         f   ; constant 10
 
-        .const_radix:    def_num     100        d   ; base: radix for output value
-        .const_array_init: def_num   20         f   ; array initialised with this constant
-        .const_radix_log: def_num    2          f   ; size of superdigit
+        .const_radix:    def_num     $radix     d   ; base: radix for output value
+        .const_array_init: def_num   $array_init f  ; array initialised with this constant
+        .const_radix_log: def_num    $radix_log f   ; size of superdigit
 
-        .const_array_len: def_num    838        f   ; len: length of remainder array
-        .var_digits_remaining: def_num 252      f   ; n: number of iterations
+        .const_array_len: def_num    $array_len f   ; len: length of remainder array
+        .var_digits_remaining: def_num $digits  f   ; n: number of iterations
 
-        .var_tmp:        def_num     0          f   ; scratch variable
+        .var_tmp:        def_num     0          d   ; scratch variable, long in .main_inner
         .var_i:          def_num     0          d   ; i: loop counter variable
-        .var_template_write: T       .array_start F ; template: transfer to array base
-        .var_template_read: A        .array_start F ; template: load from array base
+        .var_numerator:  def_num     0          d   ; divmod numerator
+        .var_denominator: def_num    0          d   ; divmod denominator
         .var_quotient:   def_num     0          d   ; q: quotient variable
         .var_remainder:  def_num     0          d   ; current remainder from array
         .var_temp_remainder: def_num 0          d   ; temporary remainder for digit extraction
@@ -0,0 +1,38 @@
+from edsac import Machine, make_word
+from edsac.checkpoint import load_checkpoint, save_checkpoint
+from edsac.tape import TapePunch
+
+# punches three rows, the codes of the letters at 200..202
+PUNCHING = {
+    10: make_word("O", 200),
+    11: make_word("O", 201),
+    12: make_word("O", 202),
+    13: make_word("Z"),
+    200: make_word("Q"),
+    201: make_word("W"),
+    202: make_word("E"),
+}
+
+
+def machine(punch):
+    mem = [0] * 1024
+    for addr, word in PUNCHING.items():
+        mem[addr] = word
+    m = Machine(mem, 10, punch=punch)
+    m.echo = False
+    return m
+
+
+def test_resume_keeps_punched_rows(tmp_path):
+    tape, checkpoint = tmp_path / "out.tape", tmp_path / "checkpoint"
+    punch = TapePunch(str(tape))
+    first = machine(punch)
+    first.run(max_orders=2)
+    save_checkpoint(first, str(checkpoint))
+    punch.close()
+
+    punch = TapePunch(str(tape), keep=True)
+    resumed = load_checkpoint(str(checkpoint), Machine, punch=punch)
+    resumed.run()
+    punch.close()
+    assert tape.read_bytes() == bytes([1, 2, 3])
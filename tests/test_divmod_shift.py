@@ -0,0 +1,34 @@
+import pytest
+
+import spigot_edsac
+
+
+@pytest.mark.parametrize("bits", [14, 20])
+def test_divmod_shift_matches_divmod(bits):
+    for numerator, denominator in [(0, 1), (12345, 1), (99999, 7), (123456, 1999)]:
+        if numerator < denominator << bits:
+            assert spigot_edsac.divmod_shift(numerator, denominator, bits) == divmod(numerator, denominator)
+
+
+def test_divmod_shift_refuses_a_wide_quotient():
+    with pytest.raises(ValueError):
+        spigot_edsac.divmod_shift(1 << 14, 1)
+    assert spigot_edsac.divmod_shift(1 << 14, 1, 15) == (1 << 14, 0)
+
+
+def test_divmod_shift_orders_as_the_routine():
+    # src/lib/divmod_shift.asm: 171 to 185 orders a call
+    assert spigot_edsac.divmod_shift_orders(0) == 171
+    assert spigot_edsac.divmod_shift_orders((1 << 14) - 1) == 185
+
+
+def test_radixes_the_routine_can_divide_for():
+    assert spigot_edsac.divmod_shift_fits(100)
+    assert not spigot_edsac.divmod_shift_fits(1000)
+    assert spigot_edsac.divmod_shift_fits(1000, 20)
+
+
+def test_main_rejects_a_radix_too_wide_for_the_routine(capsys):
+    with pytest.raises(SystemExit):
+        spigot_edsac.main(["10", "1000", "--divmod", "shift"])
+    assert "radix 1000" in capsys.readouterr().err
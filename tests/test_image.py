@@ -0,0 +1,21 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HERE, "asm"))
+import asm
+
+from edsac import load_image, load_orders
+
+PI_MEM = os.path.join(HERE, "src", "pi_mem.asm")
+
+
+def test_image_loads_as_the_listing():
+    with open(PI_MEM, "r") as source_file:
+        orders, _, image = asm.assemble(source_file.read(), source_name=PI_MEM)
+    from_image = load_image(image)
+    from_listing = load_orders(orders.splitlines())
+    assert from_image.mem == from_listing.mem
+    assert from_image.start == from_listing.start
+    assert from_image.loaded == from_listing.loaded
+    assert ".array_start" in from_image.symbols
@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HERE, "asm"))
+import asm
+
+PI_MEM = os.path.join(HERE, "src", "pi_mem.asm")
+
+
+@pytest.fixture(scope="module")
+def source():
+    with open(PI_MEM, "r") as source_file:
+        return source_file.read()
+
+
+@pytest.fixture(scope="module")
+def plan(source):
+    return asm.plan_layout(source, "array_len", source_name=PI_MEM)
+
+
+def source_params(source):
+    return {name: int(value) for name, value in re.findall(r"(?m)^def_param \$(\w+) (\d+)", source)}
+
+
+def test_plan_matches_the_source(source, plan):
+    # pi_mem.asm carries the values the planner writes back
+    assert asm.write_params(source, plan.params) == source
+    written = source_params(source)
+    assert {name: plan.params[name] for name in written} == written
+
+
+def test_plan_fills_the_store(plan):
+    layout = plan.layout
+    assert layout.overlaps == []
+    assert layout.code_end == asm.Visit.memsize - 1
+    # a[0..array_len] at 4 runs up to the code
+    (label, start, words), = layout.reserved
+    assert (label, start, words) == (".array_start", 4, plan.params["array_len"] + 1)
+    assert start + words == layout.code_start == plan.params["code_org"]
+    assert plan.params["digits"] == plan.params["array_len"] * 1000 // 3322
+
+
+def test_planned_layout_assembles_within_the_store(source, plan):
+    ast = asm.edsac_grammar().parse(source)
+    visitor = asm.place_program(ast, plan.params, pack=plan.needs_pack)
+    assert visitor.layout().overlaps == []
+    orders, _, _ = asm.assemble(source, source_name=PI_MEM, params=plan.params, pack=plan.needs_pack)
+    assert orders
+
+
+def test_one_more_element_overlaps(source, plan):
+    ast = asm.edsac_grammar().parse(source)
+    params = plan.params | {"array_len": plan.params["array_len"] + 1}
+    assert asm.place_program(ast, params, pack=True).layout().overlaps
+
+
+def test_write_params_leaves_expressions():
+    source = "def_param $array_len 1\ndef_param $digits ($array_len * 2)\n"
+    assert asm.write_params(source, {"array_len": 7, "digits": 14}) == "def_param $array_len 7\ndef_param $digits ($array_len * 2)\n"
+
+
+def test_inner_trips_from_a_parameter(source, monkeypatch):
+    trips = []
+
+    class Recording(asm.Peephole):
+        def optimize(self, tree):
+            trips.append(self.inner_trips)
+            return super().optimize(tree)
+
+    monkeypatch.setattr(asm, "Peephole", Recording)
+    asm.assemble(source, source_name=PI_MEM, optimize=True, params={"array_len": 500})
+    assert trips == [500]
+
+
+def test_inner_trips_without_const_array_len_fails():
+    source = "start .main\norg 56\n.main: halt 0 f\n"
+    with pytest.raises(Exception, match="const_array_len"):
+        asm.assemble(source, optimize=True)
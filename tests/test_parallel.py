@@ -0,0 +1,29 @@
+import multiprocessing
+
+import pytest
+
+import spigot_edsac
+import spigot_parallel
+
+
+def test_digits():
+    assert spigot_parallel.compute_pi_digits_parallel(50, 100, 4) == spigot_edsac.compute_pi_digits(50, 100)
+
+
+def test_worker_error_is_raised(monkeypatch):
+    # a radix 10**6 quotient overflows the 14 bit shift divmod in the first pass
+    monkeypatch.setattr(spigot_edsac, "divmod_local", spigot_edsac.divmod_shift)
+    with pytest.raises(ValueError, match="does not fit"):
+        spigot_parallel.compute_pi_digits_parallel(200, 10**6, 4)
+
+
+def test_carry_ring_wraps_around():
+    ring = spigot_parallel.CarryRing(multiprocessing.get_context(), depth=4)
+    try:
+        for start in range(0, 12, 3):
+            for carry in range(start, start + 3):
+                ring.put(carry)
+            assert [ring.get() for _ in range(3)] == list(range(start, start + 3))
+    finally:
+        ring.close()
+        ring.memory.unlink()
@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "asm"))
+import asm
+from edsac import TimingModel
+
+
+def test_order_times_match_the_emulator():
+    # asm.py keeps its own copy of the table so it runs standalone
+    timing = TimingModel()
+    assert (asm.Peephole.ordinary_ms, asm.Peephole.multiply_ms) == (timing.ordinary_ms, timing.multiply_ms)
+
+
+def clears_removed(read):
+    "orders the clear rule removed from a program whose mov 0 f is followed by read"
+    source = f"""
+start .main
+def_loc .scratch 0
+org 56
+.main:  add             .const_1        f
+        mov             64              f
+        mov             0               f
+        {read}
+        halt            0               f
+.const_1: def_num 1 f
+"""
+    ast = asm.edsac_grammar().parse(source)
+    peephole = asm.Peephole(inner_trips=1, symbols=asm.place_program(ast, {}).symbols)
+    peephole.optimize(ast)
+    return [change for change in peephole.changes if change.rule == "clear"]
+
+
+def test_clear_removed_when_location_0_is_never_read():
+    assert len(clears_removed("add 64 f")) == 1
+
+
+def test_clear_kept_when_location_0_is_read_through_a_label():
+    assert clears_removed("add .scratch f") == []
+
+
+def test_clear_kept_for_a_long_read_of_location_1():
+    assert clears_removed("add 1 d") == []
@@ -0,0 +1,46 @@
+import pytest
+
+from edsac import BreakpointMachine, Machine, ProfilingMachine, TranslatingMachine, make_word
+
+# prints once, then stores a stop over the output order and jumps back to it
+SELF_MODIFYING = {
+    10: make_word("O", 200),
+    11: make_word("A", 201),
+    12: make_word("T", 10),
+    13: make_word("X"),
+    14: make_word("E", 10),
+    201: make_word("Z"),
+}
+
+
+def machine(cls):
+    mem = [0] * 1024
+    for addr, word in SELF_MODIFYING.items():
+        mem[addr] = word
+    m = cls(mem, 10)
+    m.echo = False
+    return m
+
+
+def test_interpreter():
+    m = machine(Machine)
+    m.run()
+    assert (m.characters_out, m.orders_executed, m.halted) == (1, 6, True)
+
+
+@pytest.mark.parametrize("cls", [TranslatingMachine, ProfilingMachine])
+def test_budget_ending_inside_a_block(cls):
+    # run(3) ends partway through the block at 11, so T 10 is interpreted
+    m = machine(cls)
+    for budget in (1, 3, 1000):
+        m.run(budget)
+    assert (m.characters_out, m.orders_executed, m.halted) == (1, 6, True)
+
+
+def test_breakpoint_step_over_store():
+    # the order stepped past the breakpoint at 12 is T 10
+    m = machine(BreakpointMachine)
+    m.set_breakpoint(12)
+    assert m.run_to_breakpoint() == 12
+    assert m.run_to_breakpoint() is None
+    assert (m.characters_out, m.orders_executed, m.halted) == (1, 6, True)